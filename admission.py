@@ -0,0 +1,172 @@
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+import metrics
+from metrics import timed_phase
+
+# Requests running at once; 0 means one per pooled page
+ADMISSION_CONCURRENCY = int(os.environ.get("ADMISSION_CONCURRENCY", "0"))
+# Requests allowed to wait for a slot before new ones are turned away
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "8"))
+# Seconds a request may wait for a slot
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", "60"))
+# Requests one client may have queued or running; 0 disables the limit
+ADMISSION_PER_CLIENT = int(os.environ.get("ADMISSION_PER_CLIENT", "0"))
+# Header naming the caller; requests without it are keyed by client address
+ADMISSION_CLIENT_HEADER = os.environ.get("ADMISSION_CLIENT_HEADER", "X-Client-Key")
+# Job duration assumed until the first one finishes
+INITIAL_JOB_SECONDS = 30.0
+EWMA_WEIGHT = 0.2
+
+
+class Rejected(Exception):
+    """Request turned away; status is 429 (this client) or 503 (server overloaded)"""
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A granted slot, handed back with release()"""
+
+    def __init__(self, client_key):
+        self.client_key = client_key
+        self.started = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Bounded front door for browser work.
+    Up to `concurrency` requests run at once. Others wait in per-client queues
+    served round-robin, so one busy caller cannot starve the rest. Requests
+    are rejected up front when the queue is full, when the expected wait is
+    already past `max_wait`, or when they waited that long without a slot.
+    Retry-After comes from a moving average of job duration and the queue depth.
+    """
+
+    def __init__(self, concurrency=ADMISSION_CONCURRENCY, max_queue=ADMISSION_MAX_QUEUE,
+                 max_wait=ADMISSION_MAX_WAIT, per_client=ADMISSION_PER_CLIENT):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.per_client = per_client
+        self.running = 0
+        self.waiting = 0
+        self.job_seconds = INITIAL_JOB_SECONDS
+        self._queues = OrderedDict()  # client key -> deque of futures, rotated on every grant
+        self._per_client = {}  # client key -> requests queued or running
+
+    def expected_wait(self, ahead=None):
+        """Seconds until a request with `ahead` requests in front of it gets a slot"""
+        ahead = self.waiting if ahead is None else ahead
+        if self.running + ahead < self.concurrency:
+            return 0.0
+        # Running jobs are half done on average
+        return (ahead // max(self.concurrency, 1) + 0.5) * self.job_seconds
+
+    def _reject(self, status, reason):
+        metrics.admission_rejected.inc(reason=reason)
+        retry_after = max(1, math.ceil(self.expected_wait()))
+        raise Rejected(status, reason, retry_after)
+
+    def check(self, client_key):
+        """Raise Rejected if a request from client_key would be turned away right now"""
+        if self.per_client and self._per_client.get(client_key, 0) >= self.per_client:
+            self._reject(429, "client_limit")
+        if self.running < self.concurrency and not self.waiting:
+            return
+        if self.waiting >= self.max_queue:
+            self._reject(503, "queue_full")
+        if self.expected_wait() > self.max_wait:
+            self._reject(503, "overloaded")
+
+    async def acquire(self, client_key):
+        self.check(client_key)
+        if self.running < self.concurrency and not self.waiting:
+            return self._grant(client_key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(client_key, deque()).append(future)
+        self._per_client[client_key] = self._per_client.get(client_key, 0) + 1
+        self.waiting += 1
+        try:
+            with timed_phase("admission"):
+                await asyncio.wait_for(future, self.max_wait)
+            return Ticket(client_key)
+        except asyncio.TimeoutError:
+            self._forget(client_key)
+            self._reject(503, "wait_timeout")
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller went away: pass the slot on
+                self.release(Ticket(client_key), failed=True)
+            else:
+                self._forget(client_key)
+            raise
+        finally:
+            if future.cancelled() or not future.done():
+                self._dequeue(client_key, future)
+
+    def release(self, ticket, failed=False):
+        if not failed:
+            duration = time.monotonic() - ticket.started
+            self.job_seconds += EWMA_WEIGHT * (duration - self.job_seconds)
+        self._forget(ticket.client_key)
+        self.running -= 1
+        self._grant_next()
+
+    @asynccontextmanager
+    async def admit(self, client_key):
+        ticket = await self.acquire(client_key)
+        failed = False
+        try:
+            yield ticket
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.release(ticket, failed)
+
+    def _grant(self, client_key):
+        self.running += 1
+        self._per_client[client_key] = self._per_client.get(client_key, 0) + 1
+        return Ticket(client_key)
+
+    def _grant_next(self):
+        while self._queues and self.running < self.concurrency:
+            client_key, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(client_key)
+            else:
+                del self._queues[client_key]
+            self.waiting -= 1
+            if not future.done():
+                self.running += 1
+                future.set_result(None)
+
+    def _dequeue(self, client_key, future):
+        queue = self._queues.get(client_key)
+        if queue and future in queue:
+            queue.remove(future)
+            self.waiting -= 1
+            if not queue:
+                del self._queues[client_key]
+
+    def _forget(self, client_key):
+        remaining = self._per_client.get(client_key, 0) - 1
+        if remaining > 0:
+            self._per_client[client_key] = remaining
+        else:
+            self._per_client.pop(client_key, None)
+
+
+# Shared instance; main.py sizes it to the worker pool at startup
+admission = AdmissionController()
@@ -0,0 +1,225 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import metrics
+
+ASSET_CACHE = os.environ.get("ASSET_CACHE", "1") == "1"
+ASSET_CACHE_DIR = os.environ.get("ASSET_CACHE_DIR", os.path.join(os.getcwd(), "asset_cache"))
+ASSET_CACHE_MEMORY_MB = int(os.environ.get("ASSET_CACHE_MEMORY_MB", "32"))
+ASSET_CACHE_DISK_MB = int(os.environ.get("ASSET_CACHE_DISK_MB", "256"))
+# Freshness for responses that carry a validator but no max-age
+ASSET_CACHE_DEFAULT_MAX_AGE = int(os.environ.get("ASSET_CACHE_DEFAULT_MAX_AGE", "600"))
+
+CACHEABLE_TYPES = ("script", "stylesheet")
+KEPT_HEADERS = (
+    "content-type", "etag", "last-modified", "cache-control",
+    "access-control-allow-origin", "timing-allow-origin",
+)
+MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class Asset:
+    """One cached static response"""
+
+    def __init__(self, url, status, headers, body, stored_at, max_age):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = stored_at
+        self.max_age = max_age
+
+    @property
+    def fresh(self):
+        return self.stored_at + self.max_age > time.time()
+
+    def meta(self):
+        return {
+            "url": self.url, "status": self.status, "headers": self.headers,
+            "stored_at": self.stored_at, "max_age": self.max_age,
+        }
+
+
+def freshness(headers):
+    """Seconds a response may be served without revalidation, or None if it must not be stored"""
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control or "private" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    if "immutable" in cache_control:
+        return 365 * 24 * 3600
+    match = MAX_AGE.search(cache_control)
+    if match:
+        return int(match.group(1))
+    if headers.get("etag") or headers.get("last-modified"):
+        return ASSET_CACHE_DEFAULT_MAX_AGE
+    return None
+
+
+class AssetCache:
+    """
+    Route-based cache for the generator's static assets (scripts, styles, wasm).
+    Keyed by URL; entries keep their ETag/Last-Modified so stale ones are
+    revalidated with a conditional request instead of downloaded again.
+    Memory LRU plus a disk tier, both bounded by body bytes; the disk tier
+    survives browser restarts and profile re-clones.
+    """
+
+    def __init__(self, directory=ASSET_CACHE_DIR,
+                 memory_bytes=ASSET_CACHE_MEMORY_MB * 1024 * 1024,
+                 disk_bytes=ASSET_CACHE_DISK_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_memory_bytes = memory_bytes
+        self.max_disk_bytes = disk_bytes
+        self.memory_bytes = 0
+        self._memory = OrderedDict()  # url -> Asset
+        self._disk_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    async def install(self, context):
+        await context.route("**/*", self._handle)
+
+    def is_cacheable_request(self, request):
+        if request.method != "GET":
+            return False
+        return request.resource_type in CACHEABLE_TYPES or urlparse(request.url).path.endswith(".wasm")
+
+    async def _handle(self, route):
+        request = route.request
+        if not self.is_cacheable_request(request):
+            await route.fallback()
+            return
+
+        asset = await self._lookup(request.url)
+        if asset and asset.fresh:
+            metrics.asset_cache_requests.inc(result="hit")
+            await self._fulfill(route, asset)
+            return
+
+        headers = dict(request.headers)
+        if asset:
+            if asset.headers.get("etag"):
+                headers["if-none-match"] = asset.headers["etag"]
+            if asset.headers.get("last-modified"):
+                headers["if-modified-since"] = asset.headers["last-modified"]
+
+        try:
+            response = await route.fetch(headers=headers)
+        except Exception as e:
+            if asset:
+                # Origin unreachable: a stale copy beats a broken page
+                metrics.asset_cache_requests.inc(result="stale")
+                await self._fulfill(route, asset)
+            else:
+                print(f"[ASSETS] Fetch failed for {request.url}: {e}")
+                await route.fallback()
+            return
+
+        if response.status == 304 and asset:
+            metrics.asset_cache_requests.inc(result="revalidated")
+            asset.stored_at = time.time()
+            asset.max_age = freshness(response.headers) or asset.max_age
+            await self._store(asset, write_body=False)
+            await self._fulfill(route, asset)
+            return
+
+        body = await response.body()
+        metrics.asset_cache_requests.inc(result="miss")
+        max_age = freshness(response.headers)
+        if response.status == 200 and max_age is not None:
+            kept = {name: value for name, value in response.headers.items() if name in KEPT_HEADERS}
+            await self._store(Asset(request.url, 200, kept, body, time.time(), max_age))
+        await route.fulfill(response=response, body=body)
+
+    async def _fulfill(self, route, asset):
+        await route.fulfill(status=asset.status, headers=asset.headers, body=asset.body)
+
+    async def _lookup(self, url):
+        asset = self._memory.get(url)
+        if asset is not None:
+            self._memory.move_to_end(url)
+            return asset
+        asset = await asyncio.to_thread(self._read_disk, url)
+        if asset is not None:
+            self._remember(asset)
+        return asset
+
+    async def _store(self, asset, write_body=True):
+        self._remember(asset)
+        await asyncio.to_thread(self._write_disk, asset, write_body)
+
+    def _remember(self, asset):
+        previous = self._memory.pop(asset.url, None)
+        if previous is not None:
+            self.memory_bytes -= len(previous.body)
+        if len(asset.body) > self.max_memory_bytes:
+            return
+        self._memory[asset.url] = asset
+        self.memory_bytes += len(asset.body)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self.memory_bytes -= len(evicted.body)
+
+    # --- disk tier (runs in worker threads) ---
+    def _paths(self, url):
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.json"), os.path.join(self.directory, f"{name}.body")
+
+    def _read_disk(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return Asset(meta["url"], meta["status"], meta["headers"], body, meta["stored_at"], meta["max_age"])
+
+    def _write_disk(self, asset, write_body):
+        meta_path, body_path = self._paths(asset.url)
+        with self._disk_lock:
+            if write_body:
+                self._write_atomic(body_path, asset.body)
+            elif os.path.exists(body_path):
+                os.utime(body_path)  # Eviction goes by body mtime
+            self._write_atomic(meta_path, json.dumps(asset.meta()).encode("utf-8"))
+            if write_body:
+                self._evict_disk()
+
+    def _write_atomic(self, path, data):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _evict_disk(self):
+        """Remove least recently stored assets until the bodies fit the disk budget"""
+        bodies = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".body"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                bodies.append((stat.st_mtime, stat.st_size, path))
+        used = sum(size for _, size, _ in bodies)
+        for _, size, path in sorted(bodies):
+            if used <= self.max_disk_bytes:
+                break
+            for stale in (path, path[:-len(".body")] + ".json"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            used -= size
+
+
+# Shared instance; None when ASSET_CACHE is off
+asset_cache = AssetCache() if ASSET_CACHE else None
@@ -3,220 +3,1045 @@ import os
 import re
 import subprocess
 import asyncio
+import threading
+import json
+import urllib.request
+import concurrent.futures
+from collections import deque
+from contextlib import asynccontextmanager
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 
+import metrics
+from metrics import timed_phase
+from interception import NetworkStats, request_filter
+from asset_cache import asset_cache
+from profiles import ProfileManager, profile_manager
+from memory import process_tree_rss
+
+PROFILE_PATH = os.path.join(os.getcwd(), "automation_profile")
+DEBUG_PORT = int(os.environ.get("CHROME_DEBUG_PORT", "9222"))
+PAGE_POOL_SIZE = int(os.environ.get("PAGE_POOL_SIZE", "2"))
+BROWSER_WORKERS = int(os.environ.get("BROWSER_WORKERS", "1"))
+IMAGE_DEADLINE = int(os.environ.get("IMAGE_DEADLINE", "120"))  # Seconds for the whole image set
+CAPTURE_MODE = os.environ.get("CAPTURE_MODE", "observer")  # "observer" or "poll"
+PROMPT_INPUT_MODE = os.environ.get("PROMPT_INPUT_MODE", "fill")  # "fill", "assign" or "type"
+TYPE_DELAY_MS = int(os.environ.get("TYPE_DELAY_MS", "20"))  # Per-key delay for the "type" mode
+BROWSER_LAUNCH_TIMEOUT = int(os.environ.get("BROWSER_LAUNCH_TIMEOUT", "30"))
+# Memory limits; 0 disables each one
+PAGE_MAX_JOBS = int(os.environ.get("PAGE_MAX_JOBS", "50"))  # Replace a pooled page after this many jobs
+PAGE_MAX_HEAP_MB = int(os.environ.get("PAGE_MAX_HEAP_MB", "256"))  # ... or once its JS heap is above this
+BROWSER_MEMORY_BUDGET_MB = int(os.environ.get("BROWSER_MEMORY_BUDGET_MB", "768"))  # RSS of the whole Chromium tree
+MEMORY_CHECK_INTERVAL = int(os.environ.get("MEMORY_CHECK_INTERVAL", "30"))
+RENDERER_HEAP_MB = int(os.environ.get("RENDERER_HEAP_MB", "512"))  # V8 old-space cap per renderer
+# "profile": browsers run on a copy of automation_profile/; "storage_state": a blank
+# browser whose pages each get their own context seeded from STORAGE_STATE_PATH
+SESSION_MODE = os.environ.get("SESSION_MODE", "profile")
+STORAGE_STATE_PATH = os.environ.get("STORAGE_STATE_PATH", os.path.join(os.getcwd(), "storage_state.json"))
+# storage_state mode only: replace the page's context after every job instead of resetting it
+CONTEXT_PER_JOB = os.environ.get("CONTEXT_PER_JOB", "1") == "1"
+MAX_IMAGE_COUNT = int(os.environ.get("MAX_IMAGE_COUNT", "12"))  # Per job, across generate clicks
+DEFAULT_IMAGE_COUNT = 4
+# Generator iframe controls per request setting; override entries with a JSON object in GENERATOR_CONTROLS
+GENERATOR_CONTROLS = {
+    "negative_prompt": '[data-name="negative"]',
+    "style": '[data-name="artStyle"]',
+    "shape": '[data-name="shape"]',
+    "image_count": '[data-name="numImages"]',
+}
+GENERATOR_CONTROLS.update(json.loads(os.environ.get("GENERATOR_CONTROLS", "{}")))
+# Point at scripts/fake_generator.py to run offline
+GENERATOR_URL = os.environ.get("GENERATOR_URL", "https://perchance.org/ai-text-to-image-generator")
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36"
+
+# Per-image statuses reported by stream_automation_job / collect_automation_job
+IMAGE_READY = "ready"
+IMAGE_TIMEOUT = "timeout"
+IMAGE_FAILED = "failed"
+
+INPUT_MODES = ("fill", "assign", "type")
+# Picks a <select> option by value, else by its label; false if there is no such option
+SELECT_OPTION_SCRIPT = """
+(el, wanted) => {
+  const options = Array.from(el.options);
+  const option = options.find(o => o.value === wanted)
+    || options.find(o => o.textContent.trim().toLowerCase() === wanted.toLowerCase());
+  if (!option) return false;
+  el.value = option.value;
+  el.dispatchEvent(new Event('input', {bubbles: true}));
+  el.dispatchEvent(new Event('change', {bubbles: true}));
+  return true;
+}
+"""
+CLEAR_RESULTS_SCRIPT = (
+    "() => document.querySelectorAll('iframe.text-to-image-plugin-image-iframe').forEach(f => f.remove())"
+)
+# Sets the value in one step and fires the events the generator listens for
+ASSIGN_VALUE_SCRIPT = """
+(el, value) => {
+  el.value = value;
+  el.dispatchEvent(new Event('input', {bubbles: true}));
+  el.dispatchEvent(new Event('change', {bubbles: true}));
+}
+"""
+
+# Installed in every frame of a pooled page. Only the image iframes (nested
+# two levels below the top page) act on it: a MutationObserver waits for
+# #resultImgEl to get a data URL and pushes it back through the binding once.
+IMAGE_BINDING = "__perchanceImageReady"
+IMAGE_OBSERVER_SCRIPT = """
+(() => {
+  if (window.parent === window || window.parent === window.top) return;
+  let reported = false;
+  const check = () => {
+    const img = document.getElementById('resultImgEl');
+    if (reported || !img || !img.src.startsWith('data:image')) return;
+    reported = true;
+    observer.disconnect();
+    window.%s(img.src);
+  };
+  const observer = new MutationObserver(check);
+  const observe = () => {
+    observer.observe(document, {subtree: true, childList: true, attributes: true, attributeFilter: ['src']});
+    check();
+  };
+  if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', observe);
+  else observe();
+})();
+""" % IMAGE_BINDING
+
 def sanitize_filename(text):
     text = re.sub(r'[\\/*?:"<>|]', "", text)
     return text[:100]
 
-async def run_automation_job(prompt: str):
+def find_chrome_binary():
+    """Detect Chrome/Chromium binary location"""
+    possible_locations = [
+        "/usr/bin/chromium",
+        "/usr/bin/chromium-browser",
+        "/usr/bin/google-chrome",
+        "/usr/bin/google-chrome-stable",
+        "/opt/render/.cache/ms-playwright/chromium-*/chrome-linux/chrome"  # Render Playwright
+    ]
+
+    for location in possible_locations:
+        if os.path.exists(location) or "*" in location:
+            return location
+
+    # Fallback: let system find it
+    return "chromium"
+
+DEVTOOLS_LISTENING = re.compile(r"DevTools listening on (ws://\S+)")
+
+def _resolve(future, result=None, error=None):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+def fetch_devtools_url(port):
+    """Browser websocket URL from /json/version, or None if the endpoint is not up yet"""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/json/version", timeout=1) as response:
+            return json.load(response).get("webSocketDebuggerUrl")
+    except (OSError, ValueError):
+        return None
+
+def build_chrome_command(chrome_binary, port, profile_path):
+    """Render-optimized Chrome flags"""
+    return [
+        chrome_binary,
+        f"--remote-debugging-port={port}",
+        f"--user-data-dir={profile_path}",
+        # Essential flags for Render's limited environment
+        "--headless=new",
+        "--no-sandbox",
+        "--disable-gpu",
+        "--disable-dev-shm-usage",
+        "--disable-extensions",
+        "--disable-background-networking",
+        "--disable-background-timer-throttling",
+        "--disable-backgrounding-occluded-windows",
+        "--disable-renderer-backgrounding",
+        # Memory optimization for Render's 512MB limit
+        "--memory-pressure-off",
+        f"--js-flags=--max-old-space-size={RENDERER_HEAP_MB}",
+        "--disable-features=Translate,VizDisplayCompositor",
+        # Render-specific optimizations
+        "--virtual-time-budget=5000",
+        "--run-all-compositor-stages-before-draw",
+        "--disable-ipc-flooding-protection",
+        # Anti-detection (preserve NSFW access)
+        "--window-size=1920,1080",
+        f"--user-agent={USER_AGENT}",
+        "--disable-blink-features=AutomationControlled"
+    ]
+
+
+class BrowserManager:
     """
-    Render-optimized Playwright automation job.
-    Uses pre-configured profile with NSFW enabled for deployment.
+    Long-lived Chromium + Playwright driver shared by every job.
+    Started once from the FastAPI lifespan hook; relaunched automatically
+    when the browser process dies or the CDP connection drops.
+    With `profiles` set, every launch runs on a fresh working copy of the
+    profile template, discarded on relaunch and stop. With `storage_state`
+    set, every page gets its own context seeded from that file instead.
     """
-    print(f"\n--- [PLAYWRIGHT JOB STARTED] ---\nPrompt: '{prompt}'")
-    browser_process = None
-    browser = None
-    generated_images_b64 = []
-    
-    try:
-        profile_path = os.path.join(os.getcwd(), "automation_profile")
-        port = 9222
-        
-        # Detect Chrome/Chromium binary location
-        chrome_binary = None
-        possible_locations = [
-            "/usr/bin/chromium",
-            "/usr/bin/chromium-browser", 
-            "/usr/bin/google-chrome",
-            "/usr/bin/google-chrome-stable",
-            "/opt/render/.cache/ms-playwright/chromium-*/chrome-linux/chrome"  # Render Playwright
-        ]
-        
-        for location in possible_locations:
-            if os.path.exists(location) or "*" in location:
-                chrome_binary = location
-                break
-        
-        if not chrome_binary:
-            # Fallback: let system find it
-            chrome_binary = "chromium"
-        
-        print(f"[PLAYWRIGHT] Using Chrome binary: {chrome_binary}")
-        
-        # Render-optimized Chrome flags
-        command = [
-            chrome_binary,
-            f"--remote-debugging-port={port}",
-            f"--user-data-dir={profile_path}",
-            # Essential flags for Render's limited environment
-            "--headless=new",
-            "--no-sandbox",
-            "--disable-gpu",
-            "--disable-dev-shm-usage",
-            "--disable-extensions",
-            "--disable-background-networking",
-            "--disable-background-timer-throttling",
-            "--disable-backgrounding-occluded-windows",
-            "--disable-renderer-backgrounding",
-            # Memory optimization for Render's 512MB limit
-            "--memory-pressure-off",
-            "--max_old_space_size=512",
-            "--disable-features=Translate,VizDisplayCompositor",
-            # Render-specific optimizations
-            "--virtual-time-budget=5000",
-            "--run-all-compositor-stages-before-draw",
-            "--disable-ipc-flooding-protection",
-            # Anti-detection (preserve NSFW access)
-            "--window-size=1920,1080",
-            "--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36",
-            "--disable-blink-features=AutomationControlled"
-        ]
-
-        # Start browser process
-        browser_process = subprocess.Popen(
-            command, 
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            preexec_fn=os.setsid if os.name != 'nt' else None
+
+    def __init__(self, port=DEBUG_PORT, profile_path=PROFILE_PATH, profiles=None, name=None, storage_state=None):
+        self.port = port
+        self.profile_path = profile_path
+        self.profiles = profiles
+        self.name = name or f"port{port}"
+        self.storage_state_path = storage_state
+        self._storage_state = None  # Parsed once per launch, shared by every context
+        self.browser_process = None
+        self.playwright = None
+        self.browser = None
+        self.restarts = 0
+        self.generation = 0  # Bumped on every launch; pages from older generations are dead
+        self._routed_context = None
+        self._lock = asyncio.Lock()
+
+    def is_alive(self):
+        return (
+            self.browser is not None
+            and self.browser.is_connected()
+            and self.browser_process is not None
+            and self.browser_process.poll() is None
         )
-        print(f"[PLAYWRIGHT] Browser process started with PID: {browser_process.pid}")
-        
-        # Initialize Playwright
-        playwright = await async_playwright().start()
-        browser = None
-        
-        # Connection retry with optimized timing for Render
-        for attempt in range(4):  # Reduced attempts for faster failure
-            try:
-                wait_time = 2 if attempt == 0 else min(3 * attempt, 8)
-                await asyncio.sleep(wait_time)
-                print(f"[PLAYWRIGHT] Connection attempt {attempt + 1} (waiting {wait_time}s)...")
-                
-                # Check if browser process is still running
-                if browser_process.poll() is not None:
-                    stdout, stderr = browser_process.communicate()
-                    error_msg = stderr.decode() if stderr else "Unknown error"
-                    raise Exception(f"Browser process died with exit code {browser_process.poll()}: {error_msg}")
-                
-                # Connect to browser
-                browser = await playwright.chromium.connect_over_cdp(
-                    f"http://127.0.0.1:{port}",
-                    timeout=12000  # 12 second timeout
-                )
-                print("[PLAYWRIGHT] Successfully connected to browser")
-                break
-                
-            except Exception as e:
-                print(f"[PLAYWRIGHT] Connection attempt {attempt + 1} failed: {e}")
-                if browser:
-                    try:
-                        await browser.close()
-                    except:
-                        pass
-                    browser = None
-                if attempt == 3:  # Last attempt
-                    raise Exception(f"Failed to connect to browser: {e}")
-                continue
-
-        # Create page using existing context (preserves NSFW settings)
+
+    async def start(self):
+        async with self._lock:
+            if not self.is_alive():
+                await self._launch()
+
+    def rss(self):
+        """Resident bytes of the browser's process tree, None if unknown"""
+        process = self.browser_process
+        if process is None or process.poll() is not None:
+            return None
+        return process_tree_rss(process.pid)
+
+    async def restart(self, reason):
+        """Planned relaunch; pages from the old browser become unusable"""
+        async with self._lock:
+            print(f"[BROWSER] Restarting browser ({reason})")
+            metrics.browser_recycles.inc(reason=reason)
+            await self._launch()
+
+    async def get_browser(self):
+        """Return the shared browser, restarting it if it has crashed"""
+        if self.is_alive():
+            return self.browser
+        async with self._lock:
+            if not self.is_alive():
+                if self.browser is not None or self.browser_process is not None:
+                    print("[BROWSER] Browser is no longer running, restarting...")
+                    self.restarts += 1
+                    metrics.browser_restarts.inc()
+                await self._launch()
+        return self.browser
+
+    async def new_page(self):
+        """Open a fresh page in the existing context (preserves NSFW settings)"""
+        browser = await self.get_browser()
+        if self.storage_state_path:
+            return await self._new_isolated_page(browser)
         contexts = browser.contexts
         if contexts:
-            print(f"[PLAYWRIGHT] Using existing context with saved settings")
             context = contexts[0]
-            page = await context.new_page()
         else:
-            print("[PLAYWRIGHT] Creating new context")
+            print("[BROWSER] Creating new context")
             context = await browser.new_context(
                 viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36'
+                user_agent=USER_AGENT
             )
-            page = await context.new_page()
-        
+        if context is not self._routed_context:
+            await self._install_routes(context)
+            self._routed_context = context
+        return await self._open_in(context)
+
+    async def _new_isolated_page(self, browser):
+        """Page in a context of its own, seeded from the exported storage state"""
+        with timed_phase("context"):
+            context = await browser.new_context(
+                storage_state=self._storage_state,
+                viewport={'width': 1920, 'height': 1080},
+                user_agent=USER_AGENT
+            )
+            try:
+                await self._install_routes(context)
+                return await self._open_in(context)
+            except BaseException:
+                await context.close()
+                raise
+
+    async def _install_routes(self, context):
+        # Context-level, so every page opened in it inherits the routing.
+        # Handlers run last-registered-first: the filter decides before the asset cache serves.
+        if asset_cache:
+            await asset_cache.install(context)
+        if request_filter:
+            await request_filter.install(context)
+
+    async def _open_in(self, context):
+        page = await context.new_page()
+
         # Optimize page for speed
         await page.set_extra_http_headers({
             "Accept-Language": "en-US,en;q=0.9"
         })
-        
-        # Navigate to generator
-        await page.goto("https://perchance.org/ai-text-to-image-generator", 
-                       wait_until="domcontentloaded", timeout=25000)
-        
-        # Wait for and switch to main iframe
-        iframe_element = await page.wait_for_selector("#output iframe", timeout=25000)
-        iframe = await iframe_element.content_frame()
-        
-        # Fill prompt and generate
-        prompt_field = await iframe.wait_for_selector('[data-name="description"]', timeout=25000)
-        await prompt_field.click()
-        await prompt_field.fill("")
-        await prompt_field.type(prompt, delay=20)  # Slight delay to avoid detection
-        
-        generate_button = await iframe.wait_for_selector("#generateButtonEl")
-        await generate_button.click()
-        
-        # Wait for image generation (reduced timeout for Render)
-        await iframe.wait_for_selector("iframe.text-to-image-plugin-image-iframe", timeout=25000)
-        nested_iframes = await iframe.query_selector_all("iframe.text-to-image-plugin-image-iframe")
-        
-        # Process images with timeout optimization
-        for i, frame_element in enumerate(nested_iframes[:4]):  # Limit to 4 images max
+        return page
+
+    def _load_storage_state(self):
+        try:
+            with open(self.storage_state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise Exception(
+                f"Cannot read storage state {self.storage_state_path} "
+                f"(export it with scripts/profile_setup.py --export-state): {e}"
+            )
+
+    async def _launch(self):
+        await self._shutdown()
+        loop = asyncio.get_running_loop()
+        devtools_url = loop.create_future()
+        with timed_phase("launch"):
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+
+            chrome_binary = find_chrome_binary()
+            print(f"[BROWSER] Using Chrome binary: {chrome_binary}")
+
+            if self.storage_state_path:
+                self._storage_state = await asyncio.to_thread(self._load_storage_state)
+
+            if self.profiles:
+                # A crashed browser may have left its copy half-written; start clean
+                await asyncio.to_thread(self.profiles.discard, self.profile_path)
+                self.profile_path = await asyncio.to_thread(self.profiles.create, self.name)
+                print(f"[BROWSER] Profile copy: {self.profile_path}")
+
+            # stderr is drained for the whole process lifetime so the pipe never fills up
+            self.browser_process = subprocess.Popen(
+                build_chrome_command(chrome_binary, self.port, self.profile_path),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                preexec_fn=os.setsid if os.name != 'nt' else None
+            )
+            threading.Thread(
+                target=self._watch_stderr, args=(self.browser_process, loop, devtools_url), daemon=True
+            ).start()
+        print(f"[BROWSER] Browser process started with PID: {self.browser_process.pid}")
+
+        with timed_phase("connect"):
             try:
-                nested_frame = await frame_element.content_frame()
-                if not nested_frame:
-                    continue
-                
-                # Reduced timeout for Render's time limits
-                img_element = await nested_frame.wait_for_selector("#resultImgEl", timeout=120000)
-                
-                await nested_frame.wait_for_function(
-                    "document.getElementById('resultImgEl').src.includes('data:image')",
-                    timeout=120000
-                )
-                
-                b64_src = await img_element.get_attribute("src")
-                if b64_src and 'data:image' in b64_src:
-                    generated_images_b64.append(b64_src)
-                    
+                ws_url = await self._wait_for_devtools(devtools_url)
+                # Connecting to the websocket directly skips the HTTP discovery hop
+                self.browser = await self.playwright.chromium.connect_over_cdp(ws_url, timeout=12000)
             except Exception as e:
-                print(f"[PLAYWRIGHT] Error processing iframe {i}: {e}")
-                continue
-        
-        print(f"--- [PLAYWRIGHT JOB FINISHED] ---")
-        print(f"Generated {len(generated_images_b64)} images successfully")
+                await self._shutdown()
+                raise Exception(f"Failed to connect to browser: {e}")
+        print(f"[BROWSER] Successfully connected to browser at {ws_url}")
+        self.generation += 1
 
-    except Exception as e:
-        print(f"\n--- [PLAYWRIGHT JOB FAILED] ---\nError: {e}")
-        return []
-    finally:
-        # Optimized cleanup for Render
-        if browser:
+        self.browser.on("disconnected", lambda _: print("[BROWSER] Browser disconnected"))
+
+    def _watch_stderr(self, process, loop, devtools_url):
+        """Reader thread: report the DevTools endpoint, keep a short tail for diagnostics"""
+        tail = deque(maxlen=20)
+        for raw_line in iter(process.stderr.readline, b""):
+            line = raw_line.decode(errors="replace").rstrip()
+            match = DEVTOOLS_LISTENING.search(line)
+            if match:
+                loop.call_soon_threadsafe(_resolve, devtools_url, match.group(1))
+            else:
+                tail.append(line)
+        process.stderr.close()
+        error = Exception(f"Browser process exited: {' | '.join(tail) or 'no output'}")
+        try:
+            loop.call_soon_threadsafe(_resolve, devtools_url, None, error)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    async def _wait_for_devtools(self, devtools_url):
+        """
+        Websocket URL of the launched browser, as soon as it is up: whichever comes
+        first of the `DevTools listening on` stderr line and /json/version answering.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + BROWSER_LAUNCH_TIMEOUT
+        delay = 0.05
+        try:
+            while loop.time() < deadline:
+                done, _ = await asyncio.wait({devtools_url}, timeout=delay)
+                if done:
+                    return devtools_url.result()
+                ws_url = await asyncio.to_thread(fetch_devtools_url, self.port)
+                if ws_url:
+                    return ws_url
+                delay = min(delay * 2, 0.5)
+        finally:
+            # The reader thread may still report an exit later; nobody is listening then
+            devtools_url.cancel()
+        raise Exception(f"Browser did not open its DevTools endpoint within {BROWSER_LAUNCH_TIMEOUT}s")
+
+    async def _shutdown(self):
+        if self.browser:
+            try:
+                await self.browser.close()
+            except Exception as e:
+                print(f"[BROWSER] Browser cleanup error: {e}")
+            self.browser = None
+
+        if self.browser_process and self.browser_process.poll() is None:
+            print(f"[BROWSER] Terminating browser process {self.browser_process.pid}")
+            # wait() blocks, so keep it off the event loop
+            await asyncio.to_thread(self._terminate, self.browser_process)
+        self.browser_process = None
+
+    @staticmethod
+    def _terminate(process):
+        try:
+            process.terminate()
+            process.wait(timeout=3)  # Quick timeout for Render
+        except Exception:
+            try:
+                process.kill()
+                process.wait(timeout=3)
+            except:
+                pass
+
+    async def stop(self):
+        async with self._lock:
+            await self._shutdown()
+            if self.profiles:
+                await asyncio.to_thread(self.profiles.discard, self.profile_path)
+                self.profile_path = None
+            if self.playwright:
+                try:
+                    await self.playwright.stop()
+                except Exception as e:
+                    print(f"[BROWSER] Playwright cleanup error: {e}")
+                self.playwright = None
+        print("[BROWSER] Browser manager stopped.")
+
+
+class InvalidSettings(ValueError):
+    """A requested setting the generator page has no control or option for"""
+
+
+class GeneratorControl:
+    """One settings control in the generator iframe, with the value it has now"""
+
+    def __init__(self, element, is_select, default):
+        self.element = element
+        self.is_select = is_select
+        self.default = default
+        self.value = default
+
+    async def set(self, name, value):
+        if self.is_select:
+            if not await self.element.evaluate(SELECT_OPTION_SCRIPT, value):
+                raise InvalidSettings(f"'{value}' is not an option for {name}")
+        else:
+            await self.element.fill(value)
+        self.value = value
+
+    async def nearest_count(self, count):
+        """The smallest image-count option covering `count`, or the largest one there is"""
+        if not self.is_select:
+            return str(count)
+        options = await self.element.evaluate("e => Array.from(e.options).map(o => o.value)")
+        numeric = sorted(int(option) for option in options if option.isdigit())
+        if not numeric:
+            return str(count)
+        return str(next((option for option in numeric if option >= count), numeric[-1]))
+
+
+class PooledPage:
+    """A page parked on the generator iframe with the prompt field resolved"""
+
+    def __init__(self, page, generation, owns_context=False):
+        self.page = page
+        self.generation = generation
+        self.owns_context = owns_context  # Closing the page closes its context too
+        self.iframe = None
+        self.prompt_field = None
+        self.jobs = 0
+        self.network = NetworkStats()
+        self.controls = {}  # setting -> GeneratorControl
+        self._cdp = None
+        self._image_waiters = {}  # frame -> future resolved by the observer binding
+        self._early_images = {}  # frame -> data URL reported before anyone waited
+
+    async def prepare(self):
+        """Navigate to the generator and resolve the handles a job needs (once per page)"""
+        if request_filter:
+            request_filter.track(self.page, self.network)
+        if CAPTURE_MODE == "observer":
+            await self.page.expose_binding(IMAGE_BINDING, self._on_image_ready)
+            await self.page.add_init_script(IMAGE_OBSERVER_SCRIPT)
+        with timed_phase("goto"):
+            await self.page.goto(GENERATOR_URL, wait_until="domcontentloaded", timeout=25000)
+
+        # Wait for and switch to main iframe
+        with timed_phase("iframe"):
+            iframe_element = await self.page.wait_for_selector("#output iframe", timeout=25000)
+            self.iframe = await iframe_element.content_frame()
+            self.prompt_field = await self.iframe.wait_for_selector('[data-name="description"]', timeout=25000)
+            for name, selector in GENERATOR_CONTROLS.items():
+                element = await self.iframe.query_selector(selector)
+                if element:
+                    self.controls[name] = GeneratorControl(
+                        element, await element.evaluate("e => e.tagName === 'SELECT'"), await element.input_value()
+                    )
+
+    async def apply_settings(self, settings):
+        """Set the generator controls for one job; settings left out go back to the page defaults"""
+        # Without a count control the job still stops early or clicks again as needed
+        missing = [name for name in settings if name not in self.controls and name != "image_count"]
+        if missing:
+            raise InvalidSettings(f"Generator has no control for {', '.join(missing)}")
+        for name, control in self.controls.items():
+            wanted = control.default if settings.get(name) is None else str(settings[name])
+            if name == "image_count" and wanted != control.default:
+                wanted = await control.nearest_count(int(wanted))
+            if wanted != control.value:
+                await control.set(name, wanted)
+
+    def wait_for_image(self, frame):
+        """Future resolved with the frame's data URL when its observer fires"""
+        future = asyncio.get_running_loop().create_future()
+        if frame in self._early_images:
+            future.set_result(self._early_images.pop(frame))
+        else:
+            self._image_waiters[frame] = future
+            future.add_done_callback(lambda _: self._image_waiters.pop(frame, None))
+        return future
+
+    def _on_image_ready(self, source, b64_src):
+        frame = source["frame"]
+        future = self._image_waiters.pop(frame, None)
+        if future is None:
+            self._early_images[frame] = b64_src
+        elif not future.done():
+            future.set_result(b64_src)
+
+    async def heap_usage(self):
+        """Used JS heap bytes of the page's renderer, None if it cannot be read"""
+        try:
+            if self._cdp is None:
+                self._cdp = await self.page.context.new_cdp_session(self.page)
+            return (await self._cdp.send("Runtime.getHeapUsage"))["usedSize"]
+        except Exception:
+            return None
+
+    async def reset(self):
+        """Clear the prompt and drop result iframes left over from the last job"""
+        self._early_images.clear()
+        with timed_phase("reset"):
+            await self.prompt_field.fill("")
+            await self.iframe.evaluate(CLEAR_RESULTS_SCRIPT)
+
+    async def close(self):
+        try:
+            if self.owns_context:
+                await self.page.context.close()
+            else:
+                await self.page.close()
+        except Exception:
+            pass
+
+
+class PagePool:
+    """
+    Bounded set of hot pages backed by one browser.
+    Up to `size` jobs hold a page at once; the rest queue on the semaphore.
+    A slot is released only once its page has been reset in the background,
+    so every checkout gets a page that is ready to type into.
+    Pages are replaced after PAGE_MAX_JOBS jobs or above PAGE_MAX_HEAP_MB of
+    JS heap. When the browser's process tree exceeds BROWSER_MEMORY_BUDGET_MB
+    the pool stops handing out pages, lets running jobs finish, then restarts
+    the browser.
+    """
+
+    def __init__(self, manager, size=PAGE_POOL_SIZE):
+        self.manager = manager
+        self.size = size
+        self.active = 0
+        self.waiting = 0
+        self.rss = None  # Last sampled browser tree RSS
+        self._semaphore = asyncio.Semaphore(size)
+        self._open = asyncio.Event()  # Cleared while draining for a restart
+        self._open.set()
+        self._drain_lock = asyncio.Lock()  # One drain at a time; split slots would deadlock two
+        self._idle = []
+        self._background = set()
+        self._monitor = None
+
+    @property
+    def draining(self):
+        return not self._open.is_set()
+
+    async def start(self):
+        await self.manager.start()
+        await self._fill()
+        print(f"[POOL] {len(self._idle)} pages ready")
+        if BROWSER_MEMORY_BUDGET_MB and self._monitor is None:
+            self._monitor = asyncio.create_task(self._watch_memory())
+
+    async def stop(self):
+        if self._monitor:
+            self._monitor.cancel()
+            self._monitor = None
+        for task in list(self._background):
+            task.cancel()
+        self._idle.clear()
+        await self.manager.stop()
+
+    async def _fill(self):
+        while len(self._idle) < self.size:
+            self._idle.append(await self._open_page())
+
+    @asynccontextmanager
+    async def page(self):
+        """Check out a hot page for one job; it is recycled in the background afterwards"""
+        self.waiting += 1
+        try:
+            with timed_phase("queue"):
+                await self._open.wait()
+                await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        pooled = None
+        failed = False
+        try:
+            with timed_phase("checkout"):
+                pooled = await self._checkout()
+            self.active += 1
+            try:
+                yield pooled
+            except InvalidSettings:
+                raise  # The request was bad, not the page; a reset is enough
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                self.active -= 1
+                pooled.jobs += 1
+        finally:
+            if pooled is None:
+                self._semaphore.release()
+            else:
+                task = asyncio.create_task(self._recycle(pooled, failed))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+
+    async def _open_page(self):
+        page = await self.manager.new_page()
+        pooled = PooledPage(page, self.manager.generation, owns_context=bool(self.manager.storage_state_path))
+        try:
+            await pooled.prepare()
+        except BaseException:
+            await pooled.close()
+            raise
+        return pooled
+
+    def _is_usable(self, pooled):
+        return (
+            pooled.generation == self.manager.generation
+            and self.manager.is_alive()
+            and not pooled.page.is_closed()
+        )
+
+    async def _checkout(self):
+        while self._idle:
+            pooled = self._idle.pop()
+            if self._is_usable(pooled):
+                return pooled
+            await pooled.close()
+        return await self._open_page()
+
+    async def _recycle(self, pooled, failed):
+        try:
+            # A page in its own context is replaced instead, so no state leaks between jobs
+            fresh_context = pooled.owns_context and CONTEXT_PER_JOB
+            if not failed and not fresh_context and self._is_usable(pooled) and not await self._worn_out(pooled):
+                try:
+                    await pooled.reset()
+                    self._idle.append(pooled)
+                    return
+                except Exception as e:
+                    print(f"[POOL] Page reset failed, replacing page: {e}")
+            await pooled.close()
+            if self.draining:
+                return  # The restart opens fresh pages
             try:
-                await browser.close()
+                self._idle.append(await self._open_page())
             except Exception as e:
-                print(f"[PLAYWRIGHT] Browser cleanup error: {e}")
-        
-        if 'playwright' in locals():
+                # The next checkout opens a page inline instead
+                print(f"[POOL] Could not prepare replacement page: {e}")
+        finally:
+            self._semaphore.release()
+
+    async def _worn_out(self, pooled):
+        """Whether a page has done enough jobs or grown enough to be replaced"""
+        reason = None
+        if PAGE_MAX_JOBS and pooled.jobs >= PAGE_MAX_JOBS:
+            reason = "jobs"
+        elif PAGE_MAX_HEAP_MB:
+            heap = await pooled.heap_usage()
+            if heap and heap > PAGE_MAX_HEAP_MB * 1024 * 1024:
+                reason = "heap"
+        if reason:
+            print(f"[POOL] Replacing page after {pooled.jobs} jobs ({reason})")
+            metrics.page_recycles.inc(reason=reason)
+        return reason is not None
+
+    async def _watch_memory(self):
+        while True:
+            await asyncio.sleep(MEMORY_CHECK_INTERVAL)
             try:
-                await playwright.stop()
+                self.rss = await asyncio.to_thread(self.manager.rss)
+                if self.rss and self.rss > BROWSER_MEMORY_BUDGET_MB * 1024 * 1024:
+                    print(f"[POOL] Browser uses {self.rss // (1024 * 1024)} MB, "
+                          f"over the {BROWSER_MEMORY_BUDGET_MB} MB budget")
+                    await self.drain_and_restart("memory")
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                print(f"[PLAYWRIGHT] Playwright cleanup error: {e}")
-                
-        if browser_process and browser_process.poll() is None:
+                print(f"[POOL] Memory check failed: {e}")
+
+    async def drain_and_restart(self, reason):
+        """
+        Let running jobs finish, then relaunch the browser with fresh pages.
+        A drain requested while another is running waits for it, then runs its own.
+        """
+        async with self._drain_lock:
+            self._open.clear()
+            held = 0
             try:
-                print(f"[PLAYWRIGHT] Terminating browser process {browser_process.pid}")
-                browser_process.terminate()
-                browser_process.wait(timeout=3)  # Quick timeout for Render
+                # Jobs already queued on the semaphore still run; holding every slot means all are done
+                while held < self.size:
+                    await self._semaphore.acquire()
+                    held += 1
+                for pooled in self._idle:
+                    await pooled.close()
+                self._idle.clear()
+                await self.manager.restart(reason)
+                self.rss = None
+                await self._fill()
             except Exception as e:
-                try:
-                    browser_process.kill()
-                except:
-                    pass
-        print("[PLAYWRIGHT] Cleanup complete.")
-    
+                # Checkouts open pages inline (and relaunch the browser) as usual
+                print(f"[POOL] Restart after drain failed: {e}")
+            finally:
+                for _ in range(held):
+                    self._semaphore.release()
+                self._open.set()
+
+
+def session_options():
+    """BrowserManager arguments for the configured SESSION_MODE"""
+    if SESSION_MODE == "storage_state":
+        # Chromium still needs a user-data-dir; an empty throwaway one is enough
+        return {"profiles": ProfileManager(mode="empty"), "storage_state": STORAGE_STATE_PATH}
+    return {"profiles": profile_manager}
+
+
+class WorkerPool:
+    """
+    Pool of browser workers, each a separate Chromium process with its own
+    debugging port, its own snapshot of the profile template and its own page pool.
+    Every job is dispatched to the least-loaded worker.
+    """
+
+    def __init__(self, workers=BROWSER_WORKERS, pages_per_worker=PAGE_POOL_SIZE, base_port=DEBUG_PORT):
+        self.workers = workers
+        self.pages_per_worker = pages_per_worker
+        self.base_port = base_port
+        self.pools = []
+
+    @property
+    def size(self):
+        return self.workers * self.pages_per_worker
+
+    @property
+    def active(self):
+        return sum(pool.active for pool in self.pools)
+
+    @property
+    def waiting(self):
+        return sum(pool.waiting for pool in self.pools)
+
+    @property
+    def rss(self):
+        return sum(pool.rss or 0 for pool in self.pools)
+
+    async def start(self):
+        if not self.pools:
+            for i in range(self.workers):
+                manager = BrowserManager(port=self.base_port + i, name=f"worker{i}", **session_options())
+                self.pools.append(PagePool(manager, size=self.pages_per_worker))
+                print(f"[WORKERS] Worker {i}: port {manager.port}")
+
+        # Browsers launch in parallel; a worker that fails here retries on its first job
+        results = await asyncio.gather(*(pool.start() for pool in self.pools), return_exceptions=True)
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"[WORKERS] Worker {i} failed to start: {result}")
+
+    async def stop(self):
+        for pool in self.pools:
+            await pool.stop()
+        self.pools = []
+
+    async def restart(self, reason):
+        """Relaunch every worker after its running jobs finish, one worker at a time"""
+        if not self.pools:
+            await self.start()
+            return
+        # The other workers keep serving while one drains
+        for pool in self.pools:
+            await pool.drain_and_restart(reason)
+
+    def page(self):
+        """Check out a page from the least-loaded worker"""
+        if not self.pools:
+            raise Exception("Worker pool is not running")
+        # A draining worker only gets jobs when every worker is draining
+        pool = min(self.pools, key=lambda p: (p.draining, (p.active + p.waiting) / p.size))
+        return pool.page()
+
+
+if request_filter:
+    request_filter.allow_host_of(GENERATOR_URL)
+
+# Shared instance, started and stopped by the FastAPI lifespan in main.py
+worker_pool = WorkerPool()
+
+class JobResult(list):
+    """Ready data URLs in iframe order, with the status of every image the job tried"""
+
+    def __init__(self, images=(), statuses=(), wanted=1):
+        super().__init__(images)
+        self.statuses = list(statuses)
+        self.wanted = wanted
+
+    @property
+    def complete(self):
+        """Every image ready and at least as many as asked for"""
+        return bool(self) and len(self) == len(self.statuses) and len(self) >= self.wanted
+
+
+async def run_automation_job(prompt: str, pool=None, input_mode: str = None, settings: dict = None):
+    """
+    Render-optimized Playwright automation job.
+    Runs on a pre-navigated pooled page of the long-lived browser so no
+    launch, connect or page load happens on the request path.
+    Returns a JobResult of the finished images in iframe order; partial results are kept.
+    """
+    print(f"\n--- [PLAYWRIGHT JOB STARTED] ---\nPrompt: '{prompt}'")
+    try:
+        results = await collect_automation_job(prompt, pool, input_mode, settings)
+    except InvalidSettings:
+        raise  # Reported to the caller; retrying cannot help
+    except Exception as e:
+        print(f"\n--- [PLAYWRIGHT JOB FAILED] ---\nError: {e}")
+        return JobResult()
+
+    generated_images_b64 = JobResult(
+        [b64_src for _, status, b64_src in results if status == IMAGE_READY],
+        [status for _, status, _ in results],
+        wanted=(settings or {}).get("image_count", 1)
+    )
+    print(f"--- [PLAYWRIGHT JOB FINISHED] ---")
+    print(f"Generated {len(generated_images_b64)} images successfully (statuses: {generated_images_b64.statuses})")
     return generated_images_b64
 
+async def collect_automation_job(prompt: str, pool=None, input_mode: str = None, settings: dict = None):
+    """Run one job and return (iframe index, status, data URL or None) per image, in iframe order"""
+    results = []
+    async for result in stream_automation_job(prompt, pool, input_mode, settings):
+        results.append(result)
+    return sorted(results, key=lambda result: result[0])
+
+async def stream_automation_job(prompt: str, pool=None, input_mode: str = None, settings: dict = None):
+    """
+    Async generator yielding (iframe index, status, data URL or None) for each
+    image: ready images as soon as they finish, the rest once they fail or the
+    IMAGE_DEADLINE runs out. Stops once settings["image_count"] images (default
+    4) are ready. Errors before the first image propagate.
+    """
+    pool = pool or worker_pool
+    started = time.perf_counter()
+    async with pool.page() as pooled:
+        async for result in _generate_on_page(pooled, prompt, input_mode or PROMPT_INPUT_MODE, settings or {}):
+            yield result
+    metrics.phase_seconds.observe(time.perf_counter() - started, phase="job")
+
+async def _wait_for_image(pooled, index, frame_element, timeout_ms):
+    try:
+        nested_frame = await frame_element.content_frame()
+        if not nested_frame:
+            return index, IMAGE_FAILED, None
+
+        if CAPTURE_MODE == "observer":
+            # Pushed once by the frame's MutationObserver; nothing is polled
+            b64_src = await asyncio.wait_for(pooled.wait_for_image(nested_frame), timeout_ms / 1000)
+            return index, IMAGE_READY, b64_src
+
+        img_element = await nested_frame.wait_for_selector("#resultImgEl", timeout=timeout_ms)
+
+        await nested_frame.wait_for_function(
+            "document.getElementById('resultImgEl').src.includes('data:image')",
+            timeout=timeout_ms
+        )
+
+        b64_src = await img_element.get_attribute("src")
+        if b64_src and 'data:image' in b64_src:
+            return index, IMAGE_READY, b64_src
+
+    except (PlaywrightTimeoutError, asyncio.TimeoutError):
+        return index, IMAGE_TIMEOUT, None
+    except Exception as e:
+        print(f"[PLAYWRIGHT] Error processing iframe {index}: {e}")
+    return index, IMAGE_FAILED, None
+
+async def enter_prompt(prompt_field, prompt: str, input_mode: str):
+    """Put the prompt into the description field using the chosen input strategy"""
+    if input_mode == "fill":
+        await prompt_field.fill(prompt)
+    elif input_mode == "assign":
+        await prompt_field.evaluate(ASSIGN_VALUE_SCRIPT, prompt)
+    elif input_mode == "type":
+        # One key event per character; only worth it if the site starts checking for typing
+        await prompt_field.click()
+        await prompt_field.fill("")
+        await prompt_field.type(prompt, delay=TYPE_DELAY_MS)
+    else:
+        raise ValueError(f"Unknown input mode '{input_mode}', expected one of {INPUT_MODES}")
+
+async def _generate_on_page(pooled: PooledPage, prompt: str, input_mode: str, settings: dict):
+    iframe = pooled.iframe
+    pooled.network.reset()
+    wanted = settings.get("image_count") or DEFAULT_IMAGE_COUNT
+    # Only an explicit image_count asks for more clicks; otherwise one click, as many as it gives (up to 4)
+    repeat = settings.get("image_count") is not None
+
+    # Page is already sitting on the generator; enter prompt and settings, then generate
+    with timed_phase("type"):
+        await enter_prompt(pooled.prompt_field, prompt, input_mode)
+    with timed_phase("settings"):
+        await pooled.apply_settings(settings)
+
+    # Watch every image frame at once under one deadline for the whole set.
+    # A click that yields fewer images than wanted is followed by another one.
+    images_started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IMAGE_DEADLINE
+    timeout_ms = IMAGE_DEADLINE * 1000
+    ready = 0
+    next_index = 0
+    pending = set()
+    try:
+        while ready < wanted and loop.time() < deadline:
+            # A later click only gets what is left of the deadline
+            remaining_ms = max(1, (deadline - loop.time()) * 1000)
+            try:
+                with timed_phase("generate"):
+                    if next_index:
+                        await iframe.evaluate(CLEAR_RESULTS_SCRIPT)
+                    generate_button = await iframe.wait_for_selector("#generateButtonEl", timeout=min(30000, remaining_ms))
+                    await generate_button.click()
+
+                    # Wait for image generation (reduced timeout for Render)
+                    await iframe.wait_for_selector(
+                        "iframe.text-to-image-plugin-image-iframe", timeout=min(25000, remaining_ms)
+                    )
+                    nested_iframes = await iframe.query_selector_all("iframe.text-to-image-plugin-image-iframe")
+            except Exception as e:
+                if not next_index:
+                    raise  # Nothing generated yet
+                # Keep the images from earlier clicks; the rest of the set is failed
+                print(f"[PLAYWRIGHT] Generate click after {ready} images failed: {e}")
+                for index in range(next_index, next_index + wanted - ready):
+                    metrics.image_results.inc(status=IMAGE_FAILED)
+                    yield index, IMAGE_FAILED, None
+                break
+
+            indexes = {
+                asyncio.create_task(_wait_for_image(pooled, next_index + i, frame_element, timeout_ms)): next_index + i
+                for i, frame_element in enumerate(nested_iframes[:MAX_IMAGE_COUNT])
+            }
+            next_index += len(indexes)
+            pending = set(indexes)
+            round_ready = 0
+            while pending and ready < wanted:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=indexes.get):
+                    result = task.result()
+                    if result[1] == IMAGE_READY:
+                        if ready == wanted:
+                            continue  # Finished together with the last wanted image
+                        ready += 1
+                        round_ready += 1
+                    metrics.image_results.inc(status=result[1])
+                    yield result
+
+            if ready < wanted and pending:
+                # Whatever is still outstanding missed the deadline
+                for index in sorted(indexes[task] for task in pending):
+                    metrics.image_results.inc(status=IMAGE_TIMEOUT)
+                    yield index, IMAGE_TIMEOUT, None
+                break
+            if not round_ready or not repeat:
+                # A click that produced nothing would most likely fail the same way again
+                break
+    finally:
+        # Enough images, deadline hit, or the consumer went away early (e.g. client disconnected)
+        for task in pending:
+            task.cancel()
+        metrics.phase_seconds.observe(time.perf_counter() - images_started, phase="images")
+        if request_filter:
+            print(f"[NETWORK] Job requests: {pooled.network}")
+
+async def _run_standalone_job(prompt: str, input_mode: str = None, settings: dict = None):
+    # Port past the workers' range, on its own throwaway profile copy
+    manager = BrowserManager(port=DEBUG_PORT + BROWSER_WORKERS, name="standalone", **session_options())
+    pool = PagePool(manager, size=1)
+    try:
+        return await run_automation_job(prompt, pool, input_mode, settings)
+    finally:
+        await pool.stop()
+
 # Synchronous wrapper
-def run_automation_job_sync(prompt: str):
-    """Synchronous wrapper for the async automation job"""
-    return asyncio.run(run_automation_job(prompt))
\ No newline at end of file
+def run_automation_job_sync(prompt: str, input_mode: str = None, loop=None, timeout=None, settings: dict = None):
+    """
+    Synchronous wrapper for callers outside the event loop.
+    With `loop` (the server's running loop) the job is submitted there and runs
+    on the shared worker pool; it is cancelled if it outlives `timeout` seconds.
+    Without it, the job runs on its own short-lived browser.
+    """
+    if loop is None:
+        return asyncio.run(_run_standalone_job(prompt, input_mode, settings))
+
+    future = asyncio.run_coroutine_threadsafe(
+        run_automation_job(prompt, input_mode=input_mode, settings=settings), loop
+    )
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        # Cancels the task on the loop, which hands its page back to the pool
+        future.cancel()
+        print(f"--- [PLAYWRIGHT JOB CANCELLED] ---\nNo result after {timeout}s")
+    except concurrent.futures.CancelledError:
+        print("--- [PLAYWRIGHT JOB CANCELLED] ---\nEvent loop shut down")
+    return []
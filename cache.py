@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+from images import EXTENSIONS
+
+RESULT_CACHE = os.environ.get("RESULT_CACHE", "0") == "1"
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", "86400"))
+RESULT_CACHE_MEMORY_MB = int(os.environ.get("RESULT_CACHE_MEMORY_MB", "64"))
+RESULT_CACHE_DISK_MB = int(os.environ.get("RESULT_CACHE_DISK_MB", "1024"))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(os.getcwd(), "result_cache"))
+
+def normalize_prompt(prompt: str):
+    return " ".join(prompt.split()).lower()
+
+def cache_key(prompt: str, settings: dict = None):
+    """Hash of the normalized prompt plus generator settings"""
+    payload = json.dumps({"prompt": normalize_prompt(prompt), "settings": settings or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of decoded generation results, keyed by cache_key().
+    Memory tier: LRU bounded by total image bytes.
+    Disk tier: images stored once by content hash under blobs/, plus one small
+    JSON entry per key under entries/. Both tiers honour the TTL.
+    """
+
+    def __init__(self, directory=RESULT_CACHE_DIR, ttl=RESULT_CACHE_TTL,
+                 memory_bytes=RESULT_CACHE_MEMORY_MB * 1024 * 1024,
+                 disk_bytes=RESULT_CACHE_DISK_MB * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_memory_bytes = memory_bytes
+        self.max_disk_bytes = disk_bytes
+        self.memory_bytes = 0
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (created_at, images, size)
+        self._disk_lock = threading.Lock()
+        self._blob_dir = os.path.join(directory, "blobs")
+        self._entry_dir = os.path.join(directory, "entries")
+        os.makedirs(self._blob_dir, exist_ok=True)
+        os.makedirs(self._entry_dir, exist_ok=True)
+
+    async def get(self, key: str):
+        """Return the cached [(mime, bytes), ...] for key, or None"""
+        images = self._get_memory(key)
+        if images is not None:
+            self.hits += 1
+            self.memory_hits += 1
+            return images
+
+        created_at, images = await asyncio.to_thread(self._get_disk, key)
+        if images is not None:
+            self.hits += 1
+            self.disk_hits += 1
+            self._put_memory(key, created_at, images)
+            return images
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, images):
+        created_at = time.time()
+        self._put_memory(key, created_at, images)
+        await asyncio.to_thread(self._put_disk, key, created_at, images)
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.memory_bytes,
+        }
+
+    # --- memory tier ---
+    def _get_memory(self, key):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        created_at, images, size = entry
+        if created_at + self.ttl < time.time():
+            self._drop_memory(key)
+            return None
+        self._memory.move_to_end(key)
+        return images
+
+    def _put_memory(self, key, created_at, images):
+        size = sum(len(data) for _, data in images)
+        if size > self.max_memory_bytes:
+            return
+        self._drop_memory(key)
+        self._memory[key] = (created_at, images, size)
+        self.memory_bytes += size
+        while self.memory_bytes > self.max_memory_bytes:
+            self._drop_memory(next(iter(self._memory)))
+
+    def _drop_memory(self, key):
+        entry = self._memory.pop(key, None)
+        if entry:
+            self.memory_bytes -= entry[2]
+
+    # --- disk tier (runs in worker threads) ---
+    def _entry_path(self, key):
+        return os.path.join(self._entry_dir, f"{key}.json")
+
+    def _get_disk(self, key):
+        path = self._entry_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            if entry["created_at"] + self.ttl < time.time():
+                os.remove(path)
+                return None, None
+            images = []
+            for image in entry["images"]:
+                with open(os.path.join(self._blob_dir, image["blob"]), "rb") as f:
+                    images.append((image["mime"], f.read()))
+            return entry["created_at"], images
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def _put_disk(self, key, created_at, images):
+        entry = {"created_at": created_at, "images": []}
+        # Held across write + evict so eviction never removes a blob a new entry relies on
+        with self._disk_lock:
+            for mime, data in images:
+                blob = f"{hashlib.sha256(data).hexdigest()}.{EXTENSIONS.get(mime, 'bin')}"
+                blob_path = os.path.join(self._blob_dir, blob)
+                if not os.path.exists(blob_path):
+                    self._write_atomic(blob_path, data)
+                entry["images"].append({"mime": mime, "blob": blob, "size": len(data)})
+            self._write_atomic(self._entry_path(key), json.dumps(entry).encode("utf-8"))
+            self._evict_disk()
+
+    def _write_atomic(self, path, data):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _evict_disk(self):
+        """Drop expired entries, then oldest entries until blobs fit the size limit"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self._entry_dir):
+            path = os.path.join(self._entry_dir, name)
+            try:
+                with open(path) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if entry["created_at"] + self.ttl < now:
+                os.remove(path)
+            else:
+                entries.append((entry["created_at"], path, entry))
+        entries.sort(key=lambda item: item[0])
+
+        blob_sizes = {
+            name: os.path.getsize(os.path.join(self._blob_dir, name))
+            for name in os.listdir(self._blob_dir) if not name.endswith(".tmp")
+        }
+        refs = Counter(image["blob"] for _, _, entry in entries for image in entry["images"])
+        used = sum(blob_sizes.get(blob, 0) for blob in refs)
+
+        while entries and used > self.max_disk_bytes:
+            _, path, entry = entries.pop(0)
+            os.remove(path)
+            for image in entry["images"]:
+                refs[image["blob"]] -= 1
+                if refs[image["blob"]] == 0:
+                    del refs[image["blob"]]
+                    used -= blob_sizes.get(image["blob"], 0)
+
+        # Content-addressed blobs go once nothing references them
+        for blob in blob_sizes:
+            if blob not in refs:
+                os.remove(os.path.join(self._blob_dir, blob))
+
+
+# Shared instance; None when RESULT_CACHE is off
+result_cache = ResultCache() if RESULT_CACHE else None
@@ -0,0 +1,53 @@
+import asyncio
+
+
+class Flight:
+    """One in-flight call and the number of callers waiting on it"""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key onto one in-flight task.
+    Each caller awaits a shielded view of the shared task, so one caller
+    going away does not cancel it for the others; the task is cancelled
+    only when its last waiter has gone.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._flights = {}
+
+    @property
+    def in_flight(self):
+        return len(self._flights)
+
+    async def run(self, key, factory):
+        """Await factory() for key, joining an identical call already in flight"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight(asyncio.create_task(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+# Shared instance for browser generations, keyed by cache_key()
+generation_flights = SingleFlight()
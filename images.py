@@ -0,0 +1,57 @@
+import io
+import re
+import uuid
+import base64
+import zipfile
+
+DATA_URL_PATTERN = re.compile(r"^data:(?P<mime>[\w/+.-]+)?(?:;[^,]*)?;base64,", re.IGNORECASE)
+EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+def decode_data_url(data_url: str):
+    """Split a base64 `data:image/...` URL into (mime type, raw bytes)"""
+    match = DATA_URL_PATTERN.match(data_url)
+    if not match:
+        raise ValueError("Not a base64 data URL")
+    mime = match.group("mime") or "application/octet-stream"
+    return mime, base64.b64decode(data_url[match.end():])
+
+def encode_data_url(mime: str, data: bytes):
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+def decode_images(data_urls):
+    """Decode a list of data URLs; meant to run in a worker thread"""
+    return [decode_data_url(data_url) for data_url in data_urls]
+
+def encode_images(images):
+    return [encode_data_url(mime, data) for mime, data in images]
+
+def image_filename(index: int, mime: str):
+    return f"image_{index}.{EXTENSIONS.get(mime, 'bin')}"
+
+def build_zip(images):
+    """Store already-compressed images in a zip archive without recompressing"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for index, (mime, data) in enumerate(images):
+            archive.writestr(image_filename(index, mime), data)
+    return buffer.getvalue()
+
+def build_multipart(images):
+    """Return (body, boundary) for a multipart/mixed response with one part per image"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for index, (mime, data) in enumerate(images):
+        headers = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {mime}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f'Content-Disposition: attachment; filename="{image_filename(index, mime)}"\r\n\r\n'
+        )
+        parts.append(headers.encode("ascii") + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode("ascii"))
+    return b"".join(parts), boundary
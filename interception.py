@@ -0,0 +1,105 @@
+import os
+from urllib.parse import urlparse
+
+import metrics
+
+def _env_list(name, default):
+    return [item.strip().lower() for item in os.environ.get(name, default).split(",") if item.strip()]
+
+REQUEST_FILTER = os.environ.get("REQUEST_FILTER", "1") == "1"
+# Resource types dropped unless the host is allowed (Playwright resource_type names)
+BLOCK_RESOURCE_TYPES = _env_list("BLOCK_RESOURCE_TYPES", "image,media,font")
+# Hosts (and their subdomains) that are always dropped
+BLOCK_HOSTS = _env_list(
+    "BLOCK_HOSTS",
+    "doubleclick.net,googlesyndication.com,googletagmanager.com,google-analytics.com,"
+    "googleadservices.com,adservice.google.com,amazon-adsystem.com,adnxs.com,"
+    "taboola.com,outbrain.com,scorecardresearch.com,quantserve.com,hotjar.com"
+)
+# Hosts (and their subdomains) the generator needs; never blocked
+ALLOW_HOSTS = _env_list("ALLOW_HOSTS", "perchance.org")
+
+def host_matches(host, patterns):
+    return any(host == pattern or host.endswith("." + pattern) for pattern in patterns)
+
+
+class NetworkStats:
+    """Request counters for one page, reset at the start of each job"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.allowed = 0
+        self.blocked = 0
+        self.allowed_bytes = 0
+
+    def __str__(self):
+        return f"{self.allowed} allowed ({self.allowed_bytes} bytes), {self.blocked} blocked"
+
+
+class RequestFilter:
+    """
+    Context-level route handler with host and resource-type allow/deny lists.
+    Installed once per browser context so every pooled page inherits it.
+    Pages register a NetworkStats to get per-job counters.
+    """
+
+    def __init__(self, allow_hosts=ALLOW_HOSTS, block_hosts=BLOCK_HOSTS, block_types=BLOCK_RESOURCE_TYPES):
+        self.allow_hosts = list(allow_hosts)
+        self.block_hosts = list(block_hosts)
+        self.block_types = set(block_types)
+        self._page_stats = {}
+
+    def allow_host_of(self, url):
+        """Always let the generator's own host through (e.g. the local stand-in)"""
+        host = (urlparse(url).hostname or "").lower()
+        if host and host not in self.allow_hosts:
+            self.allow_hosts.append(host)
+
+    def is_blocked(self, url, resource_type):
+        host = (urlparse(url).hostname or "").lower()
+        if host_matches(host, self.block_hosts):
+            return True
+        if host_matches(host, self.allow_hosts):
+            return False
+        return resource_type in self.block_types
+
+    async def install(self, context):
+        await context.route("**/*", self._handle)
+
+    def track(self, page, stats):
+        self._page_stats[page] = stats
+        page.on("response", lambda response: self._on_response(stats, response))
+        page.on("close", lambda _: self._page_stats.pop(page, None))
+
+    async def _handle(self, route):
+        request = route.request
+        stats = self._stats_for(request)
+        if self.is_blocked(request.url, request.resource_type):
+            if stats:
+                stats.blocked += 1
+            metrics.requests_filtered.inc(action="blocked")
+            await route.abort()
+        else:
+            if stats:
+                stats.allowed += 1
+            metrics.requests_filtered.inc(action="allowed")
+            await route.fallback()
+
+    def _stats_for(self, request):
+        try:
+            return self._page_stats.get(request.frame.page)
+        except Exception:
+            # Service worker requests have no frame
+            return None
+
+    def _on_response(self, stats, response):
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            stats.allowed_bytes += int(length)
+            metrics.response_bytes.inc(int(length))
+
+
+# Shared instance; None when REQUEST_FILTER is off
+request_filter = RequestFilter() if REQUEST_FILTER else None
@@ -0,0 +1,134 @@
+import os
+import math
+import time
+import uuid
+import asyncio
+
+from automation import collect_automation_job, worker_pool, IMAGE_READY
+from images import decode_images
+from cache import cache_key
+from coalesce import generation_flights
+from admission import admission, Rejected
+import metrics
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "0"))  # 0 = one per pooled page
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", "600"))
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "100"))  # Queued jobs before submits get a 503
+
+
+class Job:
+    """One queued generation and its result"""
+
+    def __init__(self, prompt: str, input_mode: str = None, settings: dict = None, client: str = ""):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.input_mode = input_mode
+        self.settings = settings or {}
+        self.client = client  # Admission fairness key of the submitter
+        self.status = "queued"  # queued -> running -> succeeded | failed
+        self.images = []  # (mime type, raw bytes), decoded once when the job finishes
+        self.image_statuses = []
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ("succeeded", "failed")
+
+
+class JobQueue:
+    """
+    In-process job queue drained by worker tasks that call into automation.py.
+    Finished jobs are kept for `ttl` seconds so clients can poll for them.
+    Submits beyond `max_queue` waiting jobs are rejected with Retry-After.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, ttl=JOB_RESULT_TTL, max_queue=JOB_QUEUE_MAX):
+        self.workers = workers
+        self.ttl = ttl
+        self.jobs = {}
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._tasks = []
+        self._count = 0
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    async def start(self):
+        count = self._count = self.workers or worker_pool.size
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(count)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+        print(f"[JOBS] Started {count} job workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, prompt: str, input_mode: str = None, settings: dict = None, client: str = ""):
+        if self._queue.full():
+            metrics.admission_rejected.inc(reason="jobs_queue_full")
+            # A slot opens each time a worker picks up the next job
+            retry_after = max(1, math.ceil(admission.job_seconds / max(self._count, 1)))
+            raise Rejected(503, "jobs_queue_full", retry_after)
+        job = Job(prompt, input_mode, settings, client)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job.id)
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    async def _worker(self, index):
+        while True:
+            job = self.jobs.get(await self._queue.get())
+            if job is None:  # Expired before it was picked up
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                # Jobs for the same prompt that run at the same time share one generation
+                results = await generation_flights.run(
+                    ("job", cache_key(job.prompt, job.settings)), lambda: self._admitted_job(job)
+                )
+                job.image_statuses = [status for _, status, _ in results]
+                data_urls = [b64_src for _, status, b64_src in results if status == IMAGE_READY]
+                job.images = await asyncio.to_thread(decode_images, data_urls)
+                if job.images:
+                    job.status = "succeeded"
+                else:
+                    job.status = "failed"
+                    job.error = "Image generation failed. Check server logs."
+            except Exception as e:
+                print(f"[JOBS] Job {job.id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+
+    async def _admitted_job(self, job):
+        """Run a job under an admission slot like /generate; a rejection only delays it"""
+        while True:
+            try:
+                async with admission.admit(job.client):
+                    return await collect_automation_job(job.prompt, input_mode=job.input_mode, settings=job.settings)
+            except Rejected as e:
+                await asyncio.sleep(e.retry_after)
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(min(self.ttl, 60))
+            cutoff = time.time() - self.ttl
+            expired = [job_id for job_id, job in self.jobs.items() if job.done and job.finished_at < cutoff]
+            for job_id in expired:
+                del self.jobs[job_id]
+            if expired:
+                print(f"[JOBS] Expired {len(expired)} finished jobs")
+
+
+# Shared instance, started and stopped by the FastAPI lifespan in main.py
+job_queue = JobQueue()
@@ -1,18 +1,121 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional
 import os
 import subprocess
 import asyncio
+import json
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+import anyio.from_thread
+import anyio.to_thread
 
 # Import from the optimized Playwright automation file
-from automation import run_automation_job, run_automation_job_sync
+from automation import (
+    run_automation_job, run_automation_job_sync, stream_automation_job, worker_pool,
+    IMAGE_DEADLINE, MAX_IMAGE_COUNT, InvalidSettings
+)
+from jobs import job_queue
+from images import encode_images, decode_images, build_zip, build_multipart
+from cache import result_cache, cache_key
+from coalesce import generation_flights
+from admission import admission, Rejected, ADMISSION_CLIENT_HEADER
+import metrics
 
-app = FastAPI()
+# Threads serving `def` endpoints (Starlette/anyio default is 40)
+SYNC_THREADPOOL_SIZE = int(os.environ.get("SYNC_THREADPOOL_SIZE", "40"))
+# Each /generate-sync request holds a thread for its whole job; beyond this it gets a 503
+# so the remaining threads stay free for the other sync endpoints
+SYNC_MAX_IN_FLIGHT = int(os.environ.get("SYNC_MAX_IN_FLIGHT", str(max(1, SYNC_THREADPOOL_SIZE // 2))))
+SYNC_JOB_TIMEOUT = float(os.environ.get("SYNC_JOB_TIMEOUT", str(IMAGE_DEADLINE + 60)))
+
+# /batch limits
+BATCH_MAX_PROMPTS = int(os.environ.get("BATCH_MAX_PROMPTS", "500"))
+BATCH_MAX_RETRIES = int(os.environ.get("BATCH_MAX_RETRIES", "3"))
+
+sync_lock = threading.Lock()
+sync_in_flight = 0
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # /generate-sync runs its jobs on this loop and its worker pool
+    app.state.loop = asyncio.get_running_loop()
+    app.state.thread_limiter = anyio.to_thread.current_default_thread_limiter()
+    app.state.thread_limiter.total_tokens = SYNC_THREADPOOL_SIZE
+    # Launch the browser workers once and pre-create their page pools
+    try:
+        await worker_pool.start()
+    except Exception as e:
+        # Not fatal: each worker retries the launch on its first job
+        print(f"[STARTUP] Browser warm-up failed: {e}")
+    await job_queue.start()
+    if not admission.concurrency:
+        admission.concurrency = worker_pool.size
+    yield
+    await job_queue.stop()
+    await worker_pool.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(Rejected)
+async def rejected_handler(request: Request, exc: Rejected):
+    return JSONResponse(
+        status_code=exc.status,
+        content={"detail": f"Server busy ({exc.reason}), retry later", "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(InvalidSettings)
+async def invalid_settings_handler(request: Request, exc: InvalidSettings):
+    return JSONResponse(status_code=422, content={"detail": str(exc)})
+
+def client_key(http_request: Request):
+    """Admission fairness key: the client header if sent, else the client address"""
+    return http_request.headers.get(ADMISSION_CLIENT_HEADER) or (http_request.client.host if http_request.client else "")
+
+# --- METRICS ---
+metrics.Gauge("perchance_queue_depth", "Jobs waiting in the /jobs queue or for a pooled page",
+              lambda: job_queue.depth + worker_pool.waiting)
+metrics.Gauge("perchance_active_pages", "Pooled pages currently running a job", lambda: worker_pool.active)
+metrics.Gauge("perchance_pool_pages", "Page capacity across all browser workers", lambda: worker_pool.size)
+metrics.Gauge("perchance_browser_rss_bytes", "Last sampled RSS of all Chromium process trees", lambda: worker_pool.rss)
+metrics.Gauge("perchance_admission_running", "Admitted browser jobs running", lambda: admission.running)
+metrics.Gauge("perchance_admission_waiting", "Browser jobs waiting for admission", lambda: admission.waiting)
+metrics.Gauge("perchance_admission_job_seconds", "Moving average job duration used for Retry-After",
+              lambda: admission.job_seconds)
+metrics.Gauge("perchance_sync_in_flight", "/generate-sync requests currently running a job", lambda: sync_in_flight)
+metrics.Gauge("perchance_threadpool_size", "Threads available to sync endpoints",
+              lambda: app.state.thread_limiter.total_tokens)
+metrics.Gauge("perchance_threadpool_busy", "Threads currently serving sync endpoints",
+              lambda: app.state.thread_limiter.borrowed_tokens)
+metrics.Gauge("perchance_threadpool_waiting", "Sync endpoint calls waiting for a free thread",
+              lambda: app.state.thread_limiter.statistics().tasks_waiting)
+
+def record_bytes(endpoint: str, images):
+    metrics.bytes_returned.inc(sum(len(image) for image in images), endpoint=endpoint)
+
+def generation_settings(request):
+    """The settings a request actually sent, as passed to automation and cache_key()"""
+    if request.image_count is not None and not 1 <= request.image_count <= MAX_IMAGE_COUNT:
+        raise HTTPException(status_code=422, detail=f"image_count must be between 1 and {MAX_IMAGE_COUNT}")
+    fields = ("image_count", "negative_prompt", "style", "shape")
+    return {name: getattr(request, name) for name in fields if getattr(request, name) is not None}
 
 # --- MODELS ---
-class ImageRequest(BaseModel):
+class GeneratorSettings(BaseModel):
+    """Generator controls set before clicking generate; left out means the page default"""
+    image_count: Optional[int] = None  # 1 to MAX_IMAGE_COUNT; collection stops once this many are ready (default 4)
+    negative_prompt: Optional[str] = None
+    style: Optional[str] = None  # Value or label of an art style option
+    shape: Optional[str] = None  # Value or label of a shape option, e.g. "portrait"
+
+class ImageRequest(GeneratorSettings):
     prompt: str
+    bypass_cache: bool = False  # Skip the result cache lookup; a fresh result still refreshes it
+    input_mode: Optional[Literal["fill", "assign", "type"]] = None  # Defaults to PROMPT_INPUT_MODE
 
 class ImageResponse(BaseModel):
     message: str
@@ -20,6 +123,41 @@ class ImageResponse(BaseModel):
     image_count: int
     images_base64: List[str]
 
+class BatchRequest(GeneratorSettings):
+    prompts: List[str]
+    parallelism: Optional[int] = None  # Prompts generating at once; defaults to half the pooled pages
+    retries: int = 1  # Extra attempts for a prompt that produced no images
+    bypass_cache: bool = False
+    input_mode: Optional[Literal["fill", "assign", "type"]] = None
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    prompt: str
+    image_count: int
+    image_statuses: List[str] = []
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
+
+def job_response(job):
+    return JobResponse(
+        job_id=job.id,
+        status=job.status,
+        prompt=job.prompt,
+        image_count=len(job.images),
+        image_statuses=job.image_statuses,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at
+    )
+
+def get_job_or_404(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
 # --- ENDPOINTS ---
 @app.get("/")
 def read_root():
@@ -50,15 +188,58 @@ async def setup_browser_profile():
             browser_process.terminate()
         return {"message": f"Setup failed: {e}"}
     print("--- [SETUP MODE FINISHED] ---")
+
+    # Workers run on copies of the profile; restart them so they pick up the new settings
+    await worker_pool.restart("setup")
     return {"message": "Setup browser closed. Profile has been updated."}
 
+async def generate_and_cache(key: str, prompt: str, input_mode: str = None, settings: dict = None):
+    image_data = await run_automation_job(prompt, input_mode=input_mode, settings=settings)
+    # Partial sets (timeouts, failed frames, fewer than asked for) are returned but never cached
+    if image_data.complete and result_cache:
+        await result_cache.put(key, await asyncio.to_thread(decode_images, image_data))
+    elif result_cache:
+        print(f"[CACHE] Not caching incomplete result for '{prompt}'")
+    return image_data
+
+async def generate_prompt(prompt: str, bypass_cache: bool = False, input_mode: str = None,
+                          settings: dict = None, client: str = ""):
+    """
+    (images, cached) for one prompt: the result cache first, else a coalesced
+    browser job. Only the job that actually runs takes an admission slot.
+    """
+    key = cache_key(prompt, settings)
+    if result_cache and not bypass_cache:
+        cached = await result_cache.get(key)
+        if cached:
+            print(f"[CACHE] Hit for prompt: '{prompt}'")
+            return await asyncio.to_thread(encode_images, cached), True
+
+    async def admitted_generation():
+        async with admission.admit(client):
+            return await generate_and_cache(key, prompt, input_mode, settings)
+
+    # Identical in-flight requests share one browser job and one admission slot
+    image_data = await generation_flights.run(key, admitted_generation)
+    return image_data, False
+
 @app.post("/generate", response_model=ImageResponse)
-async def create_generation_job(request: ImageRequest):
+async def create_generation_job(request: ImageRequest, http_request: Request):
     print(f"Received API request for prompt: '{request.prompt}'")
-    
-    # Use the async version directly
-    image_data = await run_automation_job(request.prompt)
-    
+
+    settings = generation_settings(request)
+    image_data, cached = await generate_prompt(
+        request.prompt, request.bypass_cache, request.input_mode, settings, client_key(http_request)
+    )
+    if cached:
+        record_bytes("/generate", image_data)
+        return ImageResponse(
+            message="Image generation successful (cached).",
+            prompt=request.prompt,
+            image_count=len(image_data),
+            images_base64=image_data
+        )
+
     if not image_data:
         return ImageResponse(
             message="Image generation failed. Check server logs.",
@@ -67,6 +248,7 @@ async def create_generation_job(request: ImageRequest):
             images_base64=[]
         )
     
+    record_bytes("/generate", image_data)
     return ImageResponse(
         message="Image generation successful.",
         prompt=request.prompt, 
@@ -74,11 +256,77 @@ async def create_generation_job(request: ImageRequest):
         images_base64=image_data
     )
 
+@app.post("/generate/stream")
+async def create_generation_stream(request: ImageRequest, http_request: Request):
+    """
+    Stream one NDJSON line per image: ready images the moment their iframe
+    finishes, timed-out or failed ones with their status only.
+    """
+    print(f"Received streaming API request for prompt: '{request.prompt}'")
+    settings = generation_settings(request)
+    # Admitted before the response starts so a rejection is still a 429/503
+    ticket = await admission.acquire(client_key(http_request))
+    released = False
+
+    def release(failed=False):
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(ticket, failed)
+
+    async def ndjson_lines():
+        image_count = 0
+        failed = True
+        try:
+            async for index, status, b64_src in stream_automation_job(
+                request.prompt, input_mode=request.input_mode, settings=settings
+            ):
+                line = {"index": index, "status": status}
+                if b64_src:
+                    image_count += 1
+                    line["image_base64"] = b64_src
+                    record_bytes("/generate/stream", [b64_src])
+                yield json.dumps(line) + "\n"
+            failed = False
+        except Exception as e:
+            print(f"[STREAM] Generation failed: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            release(failed)
+        yield json.dumps({"done": True, "prompt": request.prompt, "image_count": image_count}) + "\n"
+
+    # The background task covers a client that disconnects before the body starts
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson", background=BackgroundTask(release, True))
+
 # Alternative sync endpoint if needed for compatibility
 @app.post("/generate-sync", response_model=ImageResponse)
-def create_generation_job_sync(request: ImageRequest):
+def create_generation_job_sync(request: ImageRequest, http_request: Request):
+    global sync_in_flight
     print(f"Received sync API request for prompt: '{request.prompt}'")
-    image_data = run_automation_job_sync(request.prompt)
+    settings = generation_settings(request)
+    with sync_lock:
+        if sync_in_flight >= SYNC_MAX_IN_FLIGHT:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many sync requests in flight; retry later or use /jobs",
+                headers={"Retry-After": "5"}
+            )
+        sync_in_flight += 1
+    try:
+        # Admitted like /generate, so sync traffic counts toward the same limits and Retry-After
+        ticket = anyio.from_thread.run(admission.acquire, client_key(http_request))
+        failed = True
+        try:
+            # Runs on the app's event loop and shared worker pool; this thread only waits
+            image_data = run_automation_job_sync(
+                request.prompt, request.input_mode, loop=app.state.loop, timeout=SYNC_JOB_TIMEOUT, settings=settings
+            )
+            failed = False
+        finally:
+            anyio.from_thread.run_sync(admission.release, ticket, failed)
+    finally:
+        with sync_lock:
+            sync_in_flight -= 1
     
     if not image_data:
         return ImageResponse(
@@ -88,9 +336,159 @@ def create_generation_job_sync(request: ImageRequest):
             images_base64=[]
         )
     
+    record_bytes("/generate-sync", image_data)
     return ImageResponse(
         message="Image generation successful.",
         prompt=request.prompt, 
         image_count=len(image_data), 
         images_base64=image_data
-    )
\ No newline at end of file
+    )
+
+@app.post("/batch")
+async def create_batch(request: BatchRequest, http_request: Request):
+    """
+    Generate many prompts in one request. Up to `parallelism` prompts run at
+    once across the worker pool; one NDJSON line is streamed per prompt as it
+    finishes (in completion order, with its `index`), then a summary line.
+    """
+    if not request.prompts or len(request.prompts) > BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=422, detail=f"Send between 1 and {BATCH_MAX_PROMPTS} prompts")
+    if not 0 <= request.retries <= BATCH_MAX_RETRIES:
+        raise HTTPException(status_code=422, detail=f"retries must be between 0 and {BATCH_MAX_RETRIES}")
+    settings = generation_settings(request)  # Applied to every prompt
+    # Leave pages for interactive traffic unless asked otherwise; never more than the pool has
+    parallelism = request.parallelism or max(1, worker_pool.size // 2)
+    parallelism = max(1, min(parallelism, worker_pool.size, len(request.prompts)))
+    if admission.per_client:
+        parallelism = min(parallelism, admission.per_client)
+    print(f"Received batch of {len(request.prompts)} prompts (parallelism {parallelism})")
+
+    # Every browser job the batch starts takes its own admission slot, as on /generate.
+    # Checked up front too, so a batch sent to an overloaded server is shed with 429/503.
+    client = client_key(http_request)
+    admission.check(client)
+
+    pending = deque(enumerate(request.prompts))
+    finished = asyncio.Queue()
+
+    async def run_item(index: int, prompt: str):
+        line = {"index": index, "prompt": prompt, "attempts": 0}
+        for attempt in range(1 + request.retries):
+            line["attempts"] = attempt + 1
+            delay = attempt + 1
+            try:
+                images, cached = await generate_prompt(
+                    prompt, request.bypass_cache, request.input_mode, settings, client
+                )
+            except Rejected as e:
+                images, cached = [], False
+                line["error"] = f"Rejected: {e.reason}"
+                delay = e.retry_after
+            except InvalidSettings as e:
+                # Every attempt would fail the same way
+                return {**line, "status": "failed", "image_count": 0, "error": str(e)}
+            except Exception as e:
+                images, cached = [], False
+                line["error"] = str(e)
+            if images:
+                line.pop("error", None)
+                record_bytes("/batch", images)
+                return {**line, "status": "succeeded", "cached": cached,
+                        "image_count": len(images), "images_base64": images}
+            if attempt < request.retries:
+                await asyncio.sleep(delay)
+        return {"status": "failed", "image_count": 0, "error": "Image generation failed", **line}
+
+    async def batch_worker():
+        while pending:
+            index, prompt = pending.popleft()
+            await finished.put(await run_item(index, prompt))
+
+    async def ndjson_lines():
+        workers = [asyncio.create_task(batch_worker()) for _ in range(parallelism)]
+        succeeded = 0
+        try:
+            for _ in request.prompts:
+                line = await finished.get()
+                succeeded += line["status"] == "succeeded"
+                yield json.dumps(line) + "\n"
+            yield json.dumps({
+                "done": True, "prompt_count": len(request.prompts),
+                "succeeded": succeeded, "failed": len(request.prompts) - succeeded
+            }) + "\n"
+        finally:
+            # Client gone or batch done: stop scheduling, cancel what is still running
+            pending.clear()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    stats = result_cache.stats() if result_cache else {"enabled": False}
+    stats["coalesced_requests"] = generation_flights.coalesced
+    stats["in_flight_generations"] = generation_flights.in_flight
+    return stats
+
+# --- JOBS ---
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(request: ImageRequest, http_request: Request):
+    job = job_queue.submit(request.prompt, request.input_mode, generation_settings(request), client_key(http_request))
+    print(f"Queued job {job.id} for prompt: '{request.prompt}'")
+    return job_response(job)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    return job_response(get_job_or_404(job_id))
+
+def get_finished_job(job_id: str):
+    job = get_job_or_404(job_id)
+    if not job.done:
+        raise HTTPException(status_code=409, detail=f"Job is still {job.status}")
+    return job
+
+@app.get("/jobs/{job_id}/images", response_model=ImageResponse)
+async def get_job_images(job_id: str, format: str = "json"):
+    """All images of a job: `json` (data URLs), `zip` or `multipart` (multipart/mixed, raw bytes)"""
+    job = get_finished_job(job_id)
+
+    if format == "zip":
+        body = await asyncio.to_thread(build_zip, job.images)
+        record_bytes("/jobs/images", [body])
+        return Response(
+            content=body,
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{job.id}.zip"'}
+        )
+    if format == "multipart":
+        body, boundary = await asyncio.to_thread(build_multipart, job.images)
+        record_bytes("/jobs/images", [body])
+        return Response(content=body, media_type=f"multipart/mixed; boundary={boundary}")
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format must be one of: json, zip, multipart")
+
+    images_base64 = await asyncio.to_thread(encode_images, job.images)
+    record_bytes("/jobs/images", images_base64)
+    return ImageResponse(
+        message="Image generation successful." if job.images else job.error,
+        prompt=job.prompt,
+        image_count=len(job.images),
+        images_base64=images_base64
+    )
+
+@app.get("/jobs/{job_id}/images/{n}")
+async def get_job_image(job_id: str, n: int):
+    """One image as raw bytes with its own content type"""
+    job = get_finished_job(job_id)
+    if not 0 <= n < len(job.images):
+        raise HTTPException(status_code=404, detail=f"Job has {len(job.images)} images")
+    mime, data = job.images[n]
+    record_bytes("/jobs/images/n", [data])
+    return Response(content=data, media_type=mime)
@@ -0,0 +1,57 @@
+import os
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _children(pid):
+    """Direct children of pid, from /proc/<pid>/task/*/children or a /proc scan"""
+    children = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                children.extend(int(child) for child in f.read().split())
+        return children
+    except OSError:
+        pass
+    # Kernels without CONFIG_PROC_CHILDREN: match the parent pid in every stat file
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields resume after its closing paren
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+def process_rss(pid):
+    """Resident bytes of one process, 0 if it is gone"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+def process_tree_rss(pid):
+    """
+    Resident bytes of pid and all its descendants (Chromium's browser, GPU,
+    utility and renderer processes). Shared pages are counted once per
+    process, so this overestimates a little; good enough for a budget.
+    None where /proc is unavailable.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    total = 0
+    pending = [pid]
+    seen = set()
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        total += process_rss(current)
+        pending.extend(_children(current))
+    return total
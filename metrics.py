@@ -0,0 +1,163 @@
+import time
+import threading
+from contextlib import contextmanager
+
+PHASE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = []
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(Metric):
+    """Gauge read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name, help, function):
+        super().__init__(name, help)
+        self.function = function
+
+    def _samples(self):
+        try:
+            return [f"{self.name} {self.function()}"]
+        except Exception:
+            return []
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=PHASE_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self, **labels):
+        """(sum, count) for one label set"""
+        state = self._values.get(_label_key(self.labelnames, labels))
+        return (state[-2], state[-1]) if state else (0.0, 0)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            for bound, count in zip(self.buckets, state):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', str(bound))])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+# --- shared metrics ---
+phase_seconds = Histogram(
+    "perchance_phase_seconds", "Time spent in each phase of a generation job", ["phase"]
+)
+phase_failures = Counter(
+    "perchance_phase_failures_total", "Generation failures by the phase they happened in", ["phase"]
+)
+image_results = Counter(
+    "perchance_images_total", "Images per final status (ready, timeout, failed)", ["status"]
+)
+browser_restarts = Counter(
+    "perchance_browser_restarts_total", "Browser relaunches after a crash or disconnect"
+)
+browser_recycles = Counter(
+    "perchance_browser_recycles_total", "Planned browser restarts (e.g. memory budget exceeded)", ["reason"]
+)
+page_recycles = Counter(
+    "perchance_page_recycles_total", "Pooled pages replaced after too many jobs or too much JS heap", ["reason"]
+)
+requests_filtered = Counter(
+    "perchance_browser_requests_total", "Browser requests seen by the request filter", ["action"]
+)
+response_bytes = Counter(
+    "perchance_browser_response_bytes_total", "Declared size of responses downloaded by pooled pages"
+)
+asset_cache_requests = Counter(
+    "perchance_asset_cache_requests_total", "Static asset requests by cache result (hit, miss, revalidated, stale)",
+    ["result"]
+)
+admission_rejected = Counter(
+    "perchance_admission_rejected_total",
+    "Requests turned away by admission control (client_limit, queue_full, overloaded, wait_timeout)", ["reason"]
+)
+bytes_returned = Counter(
+    "perchance_bytes_returned_total", "Image bytes sent to clients", ["endpoint"]
+)
+
+
+@contextmanager
+def timed_phase(phase):
+    """Time a block into perchance_phase_seconds; count it as a failure if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        phase_failures.inc(phase=phase)
+        raise
+    finally:
+        phase_seconds.observe(time.perf_counter() - started, phase=phase)
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
@@ -0,0 +1,136 @@
+import os
+import errno
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+PROFILE_TEMPLATE = os.environ.get("PROFILE_TEMPLATE", os.path.join(os.getcwd(), "automation_profile"))
+PROFILE_WORK_DIR = os.environ.get("PROFILE_WORK_DIR", tempfile.gettempdir())
+PROFILE_COPY_MODE = os.environ.get("PROFILE_COPY_MODE", "auto")  # "auto", "full", "minimal" or "empty"
+
+FICLONE = 0x40049409  # linux/fs.h: share extents with the source (copy-on-write)
+
+# State the generator actually needs: the NSFW toggle lives in preferences and
+# site storage, the session in cookies. Paths are relative to the profile root.
+ESSENTIAL_PATHS = (
+    "Local State",
+    "Default/Preferences",
+    "Default/Secure Preferences",
+    "Default/Cookies",
+    "Default/Local Storage",
+    "Default/IndexedDB",
+    "Default/WebStorage",
+)
+# Chromium rewrites these via temp file + rename, so a hardlink never lets a
+# worker's write reach the template. SQLite/LevelDB files are written in place
+# and must never be hardlinked.
+ATOMICALLY_REPLACED = {"Local State", "Default/Preferences", "Default/Secure Preferences"}
+# Lock files belong to whichever Chromium last used the template
+IGNORED_NAMES = ("SingletonLock", "SingletonCookie", "SingletonSocket", "lockfile")
+
+
+class ProfileManager:
+    """
+    Keeps the committed profile as a read-only golden template and hands out
+    disposable per-worker working copies.
+
+    Files are cloned with reflinks where the filesystem supports them (no data
+    is copied until Chromium writes), otherwise preferences are hardlinked and
+    the rest is copied. In "auto" mode the whole tree is cloned when reflinks
+    work and only ESSENTIAL_PATHS otherwise, to keep startup I/O small.
+    "empty" hands out blank directories (sessions come from storage state).
+    """
+
+    def __init__(self, template=PROFILE_TEMPLATE, work_dir=PROFILE_WORK_DIR, mode=PROFILE_COPY_MODE):
+        self.template = template
+        self.work_dir = work_dir
+        self.mode = mode
+        self._reflink = None  # Unknown until the first clone is tried
+
+    def create(self, name):
+        """Make a fresh working copy for one browser and return its path"""
+        target = tempfile.mkdtemp(prefix=f"automation_profile_{name}_", dir=self.work_dir)
+        if self.mode == "empty":
+            return target
+        if self.mode == "minimal" or (self.mode == "auto" and not self._reflink_supported(target)):
+            for relative in ESSENTIAL_PATHS:
+                self._copy_path(relative, target)
+        else:
+            for entry in os.listdir(self.template):
+                self._copy_path(entry, target)
+        return target
+
+    def discard(self, path):
+        # Only ever remove our own copies, never the template
+        if path and os.path.abspath(os.path.dirname(path)) == os.path.abspath(self.work_dir):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _copy_path(self, relative, target):
+        source = os.path.join(self.template, relative)
+        if os.path.basename(relative) in IGNORED_NAMES or not os.path.lexists(source):
+            return
+        destination = os.path.join(target, relative)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+        if os.path.isdir(source) and not os.path.islink(source):
+            for root, dirs, files in os.walk(source):
+                rel_root = os.path.relpath(root, self.template)
+                os.makedirs(os.path.join(target, rel_root), exist_ok=True)
+                for file_name in files:
+                    if file_name not in IGNORED_NAMES:
+                        self._clone_file(os.path.join(rel_root, file_name), target)
+        else:
+            self._clone_file(relative, target)
+
+    def _clone_file(self, relative, target):
+        source = os.path.join(self.template, relative)
+        destination = os.path.join(target, relative)
+        if os.path.islink(source):
+            return
+        if self._reflink is not False and self._try_reflink(source, destination):
+            return
+        if relative.replace(os.sep, "/") in ATOMICALLY_REPLACED:
+            try:
+                os.link(source, destination)
+                return
+            except OSError:
+                pass
+        shutil.copy2(source, destination)
+
+    def _try_reflink(self, source, destination):
+        if fcntl is None:
+            self._reflink = False
+            return False
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                self._reflink = True
+                return True
+            except OSError as e:
+                if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+                    self._reflink = False
+        os.remove(destination)
+        return False
+
+    def _reflink_supported(self, target):
+        """Probe once by cloning the template's Local State into the new copy"""
+        if self._reflink is None:
+            probe = os.path.join(self.template, "Local State")
+            if fcntl is None or not os.path.exists(probe):
+                self._reflink = False
+            else:
+                self._try_reflink(probe, os.path.join(target, ".reflink_probe"))
+                try:
+                    os.remove(os.path.join(target, ".reflink_probe"))
+                except OSError:
+                    pass
+            print(f"[PROFILES] Reflink copies {'available' if self._reflink else 'unavailable'}")
+        return bool(self._reflink)
+
+
+# Shared instance used by every browser worker
+profile_manager = ProfileManager()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the automation layer against the local stand-in
+generator (scripts/fake_generator.py). Run from the repository root:
+
+    python scripts/benchmark.py --concurrency 1 2 4 --jobs 8 --output bench.json
+
+Reports cold-start time, time-to-first-image, p50/p95/p99 job latency and
+throughput per concurrency level as JSON, tagged with the current commit
+so runs can be compared across commits.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, os.path.dirname(SCRIPTS_DIR))
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def summarize(values):
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else None,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return None
+
+def make_prompt(label, length):
+    """Prompt padded to `length` characters so input strategies can be compared"""
+    return (label + " " + "detailed scenery " * (length // 17 + 1))[:max(length, len(label))]
+
+async def timed_job(automation, prompt, input_mode, settings=None):
+    """Run one job; return (latency, time to first image, images)"""
+    started = time.perf_counter()
+    first_image = None
+    images = 0
+    try:
+        async for _, status, _ in automation.stream_automation_job(prompt, input_mode=input_mode, settings=settings):
+            if status == automation.IMAGE_READY:
+                images += 1
+                if first_image is None:
+                    first_image = time.perf_counter() - started
+    except Exception as e:
+        print(f"[BENCH] Job failed: {e}")
+    return time.perf_counter() - started, first_image, images
+
+def job_settings(args):
+    return {"image_count": args.image_count} if args.image_count else {}
+
+async def run_level(automation, concurrency, args):
+    from metrics import phase_seconds
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i):
+        async with semaphore:
+            prompt = make_prompt(f"benchmark prompt {concurrency}-{i}", args.prompt_length)
+            return await timed_job(automation, prompt, args.input_mode, job_settings(args))
+
+    typing_sum, typing_count = phase_seconds.snapshot(phase="type")
+    started = time.perf_counter()
+    results = await asyncio.gather(*(limited(i) for i in range(args.jobs)))
+    wall = time.perf_counter() - started
+    typing_sum_after, typing_count_after = phase_seconds.snapshot(phase="type")
+    typing_jobs = typing_count_after - typing_count
+
+    latencies = [latency for latency, _, images in results if images]
+    first_images = [first for _, first, _ in results if first is not None]
+    return {
+        "concurrency": concurrency,
+        "jobs": args.jobs,
+        "failed_jobs": sum(1 for _, _, images in results if not images),
+        "images": sum(images for _, _, images in results),
+        "wall_seconds": wall,
+        "throughput_jobs_per_second": len(latencies) / wall if wall else None,
+        "latency_seconds": summarize(latencies),
+        "time_to_first_image_seconds": summarize(first_images),
+        "mean_typing_seconds": (typing_sum_after - typing_sum) / typing_jobs if typing_jobs else None,
+    }
+
+async def run_benchmark(args):
+    import automation
+
+    cold_start = time.perf_counter()
+    await automation.worker_pool.start()
+    cold_start = time.perf_counter() - cold_start
+
+    try:
+        # One throwaway job so every level starts from warm, hot pages
+        await timed_job(automation, "warm-up", args.input_mode, job_settings(args))
+        levels = [await run_level(automation, c, args) for c in args.concurrency]
+    finally:
+        await automation.worker_pool.stop()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "config": {
+            "browser_workers": automation.BROWSER_WORKERS,
+            "page_pool_size": automation.PAGE_POOL_SIZE,
+            "capture_mode": automation.CAPTURE_MODE,
+            "input_mode": args.input_mode or automation.PROMPT_INPUT_MODE,
+            "prompt_length": args.prompt_length,
+            "generator_url": automation.GENERATOR_URL,
+            "delay": args.delay,
+            "jitter": args.jitter,
+            "images": args.images,
+            "image_count": args.image_count,
+        },
+        "cold_start_seconds": cold_start,
+        "levels": levels,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the automation layer offline")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--jobs", type=int, default=8, help="jobs per concurrency level")
+    parser.add_argument("--port", type=int, default=8765, help="port for the stand-in site")
+    parser.add_argument("--delay", type=float, default=2.0)
+    parser.add_argument("--jitter", type=float, default=1.0)
+    parser.add_argument("--images", type=int, default=4)
+    parser.add_argument("--image-count", type=int, help="images requested per job (default: the generator's 4)")
+    parser.add_argument("--input-mode", choices=["fill", "assign", "type"], help="default: PROMPT_INPUT_MODE")
+    parser.add_argument("--prompt-length", type=int, default=200, help="characters per prompt")
+    parser.add_argument("--url", help="benchmark this generator URL instead of starting the stand-in")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        os.environ["GENERATOR_URL"] = args.url
+    else:
+        import fake_generator
+        server = fake_generator.serve(args.port, delay=args.delay, jitter=args.jitter, images=args.images)
+        os.environ["GENERATOR_URL"] = f"http://127.0.0.1:{args.port}/ai-text-to-image-generator"
+
+    try:
+        report = asyncio.run(run_benchmark(args))
+    finally:
+        if server:
+            server.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"[BENCH] Report written to {args.output}")
+    else:
+        print(output)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Perchance text-to-image generator.
+Serves the same DOM contract automation.py relies on, so jobs can be
+benchmarked and regression-tested offline:
+
+  /ai-text-to-image-generator   top page with the generator in `#output iframe`
+  /generator                    `[data-name="description"]` + `#generateButtonEl`;
+                                clicking adds `iframe.text-to-image-plugin-image-iframe` frames;
+                                settings controls `[data-name="negative"]`, `[data-name="artStyle"]`,
+                                `[data-name="shape"]` and `[data-name="numImages"]`
+  /image                        `#resultImgEl` whose src becomes a PNG data URL after a delay
+
+Usage:
+    python scripts/fake_generator.py --port 8765 --delay 3 --jitter 1
+    GENERATOR_URL=http://127.0.0.1:8765/ai-text-to-image-generator uvicorn main:app
+"""
+
+import json
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+TOP_PAGE = """<!DOCTYPE html>
+<html><head><title>AI Text to Image Generator (local stand-in)</title></head>
+<body>
+  <h1>AI Text to Image Generator</h1>
+  <div id="output"><iframe src="/generator" style="width:100%;height:900px;border:0"></iframe></div>
+</body></html>
+"""
+
+GENERATOR_PAGE = """<!DOCTYPE html>
+<html><head><title>generator</title></head>
+<body>
+  <textarea data-name="description" rows="4" cols="80"></textarea>
+  <textarea data-name="negative" rows="2" cols="80"></textarea>
+  <select data-name="artStyle">
+    <option value="">No style</option>
+    <option value="painted-anime">Painted Anime</option>
+    <option value="cinematic">Cinematic</option>
+    <option value="digital-painting">Digital Painting</option>
+  </select>
+  <select data-name="shape">
+    <option value="square">Square</option>
+    <option value="portrait">Portrait</option>
+    <option value="landscape">Landscape</option>
+  </select>
+  <select data-name="numImages"></select>
+  <button id="generateButtonEl">generate</button>
+  <div id="resultsEl"></div>
+  <script>
+    const CONFIG = %(config)s;
+    const count = document.querySelector('[data-name="numImages"]');
+    for (let n = 1; n <= CONFIG.images; n++) count.add(new Option(String(n), String(n), false, n === CONFIG.images));
+    // Width and height factors per shape
+    const SHAPES = {square: [1, 1], portrait: [0.75, 1], landscape: [1, 0.75]};
+    document.getElementById('generateButtonEl').addEventListener('click', () => {
+      const results = document.getElementById('resultsEl');
+      results.innerHTML = '';
+      const [w, h] = SHAPES[document.querySelector('[data-name="shape"]').value];
+      for (let i = 0; i < Number(count.value); i++) {
+        const delay = CONFIG.delay + Math.random() * CONFIG.jitter;
+        const frame = document.createElement('iframe');
+        frame.className = 'text-to-image-plugin-image-iframe';
+        frame.src = `/image?i=${i}&delay=${delay}&w=${Math.round(CONFIG.size * w)}&h=${Math.round(CONFIG.size * h)}`;
+        results.appendChild(frame);
+      }
+    });
+  </script>
+</body></html>
+"""
+
+IMAGE_PAGE = """<!DOCTYPE html>
+<html><head><title>image</title></head>
+<body>
+  <img id="resultImgEl" src="">
+  <script>
+    const CONFIG = %(config)s;
+    const params = new URLSearchParams(location.search);
+    setTimeout(() => {
+      // Random pixels so the PNG is roughly as heavy as a real result
+      const canvas = document.createElement('canvas');
+      canvas.width = Number(params.get('w')) || CONFIG.size;
+      canvas.height = Number(params.get('h')) || CONFIG.size;
+      const ctx = canvas.getContext('2d');
+      const pixels = ctx.createImageData(canvas.width, canvas.height);
+      for (let p = 0; p < pixels.data.length; p++) pixels.data[p] = (p %% 4 === 3) ? 255 : Math.random() * 255;
+      ctx.putImageData(pixels, 0, 0);
+      document.getElementById('resultImgEl').src = canvas.toDataURL('image/png');
+    }, Number(params.get('delay')) * 1000);
+  </script>
+</body></html>
+"""
+
+def render_pages(delay=3.0, jitter=1.0, images=4, size=512):
+    """Return {path: html} for the stand-in site with the given timing"""
+    config = json.dumps({"delay": delay, "jitter": jitter, "images": images, "size": size})
+    return {
+        "/ai-text-to-image-generator": TOP_PAGE,
+        "/generator": GENERATOR_PAGE % {"config": config},
+        "/image": IMAGE_PAGE % {"config": config},
+    }
+
+def serve(port=8765, **page_options):
+    """Start the stand-in site on a background thread and return the server"""
+    pages = render_pages(**page_options)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = pages.get(urlparse(self.path).path)
+            if body is None:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Perchance generator")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=3.0, help="seconds before an image is ready")
+    parser.add_argument("--jitter", type=float, default=1.0, help="random extra seconds per image")
+    parser.add_argument("--images", type=int, default=4, help="image iframes per generation (largest numImages option)")
+    parser.add_argument("--size", type=int, default=512, help="image width/height in pixels")
+    args = parser.parse_args()
+
+    server = serve(args.port, delay=args.delay, jitter=args.jitter, images=args.images, size=args.size)
+    print(f"🧪 Stand-in generator on http://127.0.0.1:{args.port}/ai-text-to-image-generator")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
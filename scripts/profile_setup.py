@@ -2,6 +2,10 @@
 """
 Local setup script to configure the browser profile with NSFW enabled.
 Run this locally before deploying to Render.
+
+Also exports the session as Playwright storage state (storage_state.json) for
+SESSION_MODE=storage_state. To re-export from an existing profile only:
+    python scripts/profile_setup.py --export-state
 """
 
 import os
@@ -19,6 +23,38 @@ except ImportError:
     subprocess.check_call([sys.executable, "-m", "playwright", "install", "chromium"])
     from playwright.async_api import async_playwright
 
+GENERATOR_URL = "https://perchance.org/ai-text-to-image-generator"
+STORAGE_STATE_PATH = os.path.join(os.getcwd(), "storage_state.json")
+
+async def save_storage_state(context, path=STORAGE_STATE_PATH):
+    """Write cookies, localStorage and IndexedDB of the context to a JSON file"""
+    # Storage is collected per origin, so have the generator open first
+    page = await context.new_page()
+    await page.goto(GENERATOR_URL, timeout=60000)
+    try:
+        await context.storage_state(path=path, indexed_db=True)
+    except TypeError:
+        # Playwright < 1.51 cannot export IndexedDB
+        print("⚠️  This Playwright version cannot export IndexedDB; saving cookies and localStorage only")
+        await context.storage_state(path=path)
+    await page.close()
+    print(f"💾 Storage state saved to: {path} ({os.path.getsize(path) / 1024:.1f} KB)")
+
+async def export_storage_state(profile_path=None, path=STORAGE_STATE_PATH):
+    """Export the storage state of an already configured profile"""
+    profile_path = profile_path or os.path.join(os.getcwd(), "automation_profile")
+    playwright = await async_playwright().start()
+    try:
+        context = await playwright.chromium.launch_persistent_context(
+            user_data_dir=profile_path,
+            headless=True,
+            args=['--no-first-run', '--disable-default-apps']
+        )
+        await save_storage_state(context, path)
+        await context.close()
+    finally:
+        await playwright.stop()
+
 async def setup_browser_profile_with_nsfw():
     """Setup browser profile with NSFW toggle enabled"""
     print("=== Setting up browser profile with NSFW enabled ===")
@@ -105,6 +141,8 @@ async def setup_browser_profile_with_nsfw():
         
         print("✅ Profile test complete")
         await test_page.close()
+
+        await save_storage_state(browser)
         
         # Now close the browser
         print("🔄 Closing browser and saving profile...")
@@ -159,6 +197,10 @@ fi
     print("Created profile_backup.sh for easy backup/restore")
 
 if __name__ == "__main__":
+    if "--export-state" in sys.argv:
+        asyncio.run(export_storage_state())
+        sys.exit(0)
+
     print("🚀 Starting local profile setup...")
     print("📋 This will help you configure NSFW settings for Perchance")
     print("-" * 50)
@@ -171,8 +213,9 @@ if __name__ == "__main__":
             print("\n🎉 SUCCESS!")
             print("✅ Profile configured with NSFW settings")
             print("✅ Backup script created (profile_backup.sh)")
+            print("✅ Storage state exported (storage_state.json, for SESSION_MODE=storage_state)")
             print("\n📝 Next steps:")
-            print("1. Add profile to git: git add automation_profile/")
+            print("1. Add profile to git: git add automation_profile/ storage_state.json")
             print("2. Commit: git commit -m 'Add NSFW-enabled profile'")
             print("3. Push to GitHub: git push")
             print("4. Deploy to Render!")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Build a minimal copy of automation_profile/ with only the state the generator
+needs (preferences, cookies, site storage) and drop Chromium's component
+payloads (ZxcvbnData, AutofillStates, OptimizationHints, shader caches, ...).
+
+The slim profile is then checked against the original: both are launched on
+throwaway copies, the generator URL is routed to the local stand-in page, and
+the cookies, localStorage and IndexedDB each origin sees must match.
+
+Usage:
+    python scripts/slim_profile.py --output automation_profile_slim
+    PROFILE_TEMPLATE=./automation_profile_slim uvicorn main:app
+"""
+
+import os
+import sys
+import json
+import shutil
+import asyncio
+import argparse
+import tempfile
+from urllib.parse import urlparse
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, os.path.dirname(SCRIPTS_DIR))
+
+from profiles import ESSENTIAL_PATHS, IGNORED_NAMES, ProfileManager
+from fake_generator import render_pages
+
+GENERATOR_URL = "https://perchance.org/ai-text-to-image-generator"
+# Diagnostics only; Chromium recreates them
+SKIPPED_NAMES = set(IGNORED_NAMES) | {"LOG", "LOG.old"}
+
+# Everything a page on one origin can read back from the profile
+SNAPSHOT_SCRIPT = """
+async () => {
+  const storage = {};
+  for (let i = 0; i < localStorage.length; i++) {
+    const key = localStorage.key(i);
+    storage[key] = localStorage.getItem(key);
+  }
+  const databases = {};
+  for (const info of (await indexedDB.databases())) {
+    const db = await new Promise((resolve, reject) => {
+      const request = indexedDB.open(info.name);
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => reject(request.error);
+    });
+    const stores = {};
+    for (const name of db.objectStoreNames) {
+      stores[name] = await new Promise((resolve) => {
+        const request = db.transaction(name).objectStore(name).getAll();
+        request.onsuccess = () => {
+          try { resolve(JSON.parse(JSON.stringify(request.result))); }
+          catch (e) { resolve(`<${request.result.length} unserializable records>`); }
+        };
+        request.onerror = () => resolve(null);
+      });
+    }
+    databases[info.name] = stores;
+    db.close();
+  }
+  return {localStorage: storage, indexedDB: databases, language: navigator.language};
+}
+"""
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
+
+def build_slim_profile(source, output):
+    """Copy ESSENTIAL_PATHS from source into output"""
+    for relative in ESSENTIAL_PATHS:
+        source_path = os.path.join(source, relative)
+        target_path = os.path.join(output, relative)
+        if not os.path.exists(source_path):
+            print(f"   - {relative} (not in source, skipped)")
+            continue
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if os.path.isdir(source_path):
+            shutil.copytree(
+                source_path, target_path, symlinks=True,
+                ignore=lambda _, names: [name for name in names if name in SKIPPED_NAMES]
+            )
+        else:
+            shutil.copy2(source_path, target_path)
+        print(f"   + {relative}")
+
+def profile_origins(profile_path):
+    """Origins with stored site data, read from the IndexedDB directory names"""
+    origins = {f"{urlparse(GENERATOR_URL).scheme}://{urlparse(GENERATOR_URL).netloc}"}
+    indexeddb = os.path.join(profile_path, "Default", "IndexedDB")
+    if os.path.isdir(indexeddb):
+        for name in os.listdir(indexeddb):
+            # e.g. https_sub.perchance.org_0.indexeddb.leveldb
+            scheme, _, rest = name.partition("_")
+            host = rest.rsplit("_", 1)[0]
+            if scheme in ("http", "https") and host:
+                origins.add(f"{scheme}://{host}")
+    return sorted(origins)
+
+async def snapshot_profile(playwright, profile_path, origins):
+    """Launch on a throwaway copy of the profile and record what each origin sees"""
+    copies = ProfileManager(template=profile_path, work_dir=tempfile.gettempdir(), mode="full")
+    working_copy = copies.create("verify")
+    pages = render_pages(delay=0, jitter=0)
+    try:
+        context = await playwright.chromium.launch_persistent_context(
+            user_data_dir=working_copy, headless=True, args=["--no-first-run", "--disable-default-apps"]
+        )
+        try:
+            async def serve_stand_in(route):
+                url = urlparse(route.request.url)
+                origin = f"{url.scheme}://{url.netloc}"
+                if route.request.url.split("?")[0] == GENERATOR_URL:
+                    body = pages["/ai-text-to-image-generator"]
+                elif origin in origins and url.path in pages:
+                    body = pages[url.path]
+                elif origin in origins:
+                    body = "<!DOCTYPE html><title>stand-in</title>"
+                else:
+                    # Nothing leaves the machine
+                    await route.abort()
+                    return
+                await route.fulfill(status=200, content_type="text/html", body=body)
+
+            await context.route("**/*", serve_stand_in)
+            page = await context.new_page()
+            snapshot = {}
+            for origin in origins:
+                url = GENERATOR_URL if GENERATOR_URL.startswith(origin + "/") else origin + "/"
+                await page.goto(url, timeout=30000)
+                snapshot[origin] = await page.evaluate(SNAPSHOT_SCRIPT)
+            snapshot["cookies"] = sorted(
+                (cookie["domain"], cookie["name"], cookie["value"]) for cookie in await context.cookies()
+            )
+            return snapshot
+        finally:
+            await context.close()
+    finally:
+        copies.discard(working_copy)
+
+async def verify(source, output):
+    from playwright.async_api import async_playwright
+
+    origins = profile_origins(source)
+    print(f"🔍 Comparing what {len(origins)} origin(s) see: {', '.join(origins)}")
+    async with async_playwright() as playwright:
+        expected = await snapshot_profile(playwright, source, origins)
+        actual = await snapshot_profile(playwright, output, origins)
+
+    mismatches = [key for key in expected if expected[key] != actual.get(key)]
+    for key in mismatches:
+        print(f"❌ {key} differs")
+        print(f"   original: {json.dumps(expected[key], sort_keys=True)[:500]}")
+        print(f"   slim:     {json.dumps(actual.get(key), sort_keys=True)[:500]}")
+    if not mismatches:
+        print(f"✅ Slim profile matches: {len(expected['cookies'])} cookies, "
+              f"{sum(len(v['localStorage']) for k, v in expected.items() if k != 'cookies')} localStorage keys")
+    return not mismatches
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a minimal browser profile for the generator")
+    parser.add_argument("--source", default=os.path.join(os.getcwd(), "automation_profile"))
+    parser.add_argument("--output", default=os.path.join(os.getcwd(), "automation_profile_slim"))
+    parser.add_argument("--force", action="store_true", help="replace an existing output directory")
+    parser.add_argument("--no-verify", action="store_true", help="skip the browser comparison")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.source):
+        sys.exit(f"❌ No profile at {args.source}; run scripts/profile_setup.py first")
+    if os.path.exists(args.output):
+        if not args.force:
+            sys.exit(f"❌ {args.output} already exists (use --force to replace it)")
+        shutil.rmtree(args.output)
+
+    print(f"📁 Building slim profile: {args.source} -> {args.output}")
+    build_slim_profile(args.source, args.output)
+    before, after = directory_size(args.source), directory_size(args.output)
+    print(f"📦 {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+
+    if not args.no_verify and not asyncio.run(verify(args.source, args.output)):
+        sys.exit(1)
+    print(f"🚀 Use it with PROFILE_TEMPLATE={args.output} or copy it over automation_profile/")